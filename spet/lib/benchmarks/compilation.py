@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 """Timed Linux kernel compilation speeds."""
 
+import concurrent.futures
+import hashlib
 import logging
 import os
+import shutil
 import statistics
+import threading
 import time
 
+from spet.lib.utilities import cache
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
@@ -26,6 +32,7 @@ class CompilationSpeed:
         version (str): Version number for the Linux kernel.
         src_dir (str): The source directory for installing packages.
         kernel_dir (str): The source directory for the Linux kernel.
+        cache_dir (str): The directory for artifacts reused between runs.
         results_dir (str): The results directory for the speed results.
     """
 
@@ -33,30 +40,77 @@ class CompilationSpeed:
         self.version = version
         self.src_dir = root_dir + "/src"
         self.kernel_dir = self.src_dir + "/linux"
+        self.cache_dir = self.src_dir + "/.cache"
         self.results_dir = results_dir + "/kernel"
         self.commands = []
+        self.__tree_lock = threading.Lock()
 
-    def download(self):
+    def download(self, cache_artifacts=True, expected_sha256=None):
         """Download the Linux kernel.
 
+        An archive left by an earlier run is only reused if its SHA-256
+        checksum matches, so a truncated download is fetched again. The
+        archive is recorded in the artifact cache so the Docker benchmark
+        can reuse it instead of downloading the kernel again.
+
+        Args:
+            cache_artifacts (bool, optional): Whether to record the archive in
+                the artifact cache.
+            expected_sha256 (str, optional): The archive's checksum. Defaults
+                to the checksum published by kernel.org.
+
         Returns:
             Boolean: True if download was successful otherwise False.
         """
         major_version = self.version.split(".")[0]
-        url = ("http://www.kernel.org/pub/linux/kernel/v{}.x/"
-               "linux-{}.tar.gz").format(major_version, self.version)
-        archive_path = "{}/linux-{}.tar.gz".format(self.src_dir, self.version)
-
-        if os.path.isfile(archive_path):
-            return True
-
-        logging.info("Downloading the Linux kernel.")
-
-        download.file(url, archive_path)
+        archive_name = "linux-{}.tar.gz".format(self.version)
+        url = "http://www.kernel.org/pub/linux/kernel/v{}.x/{}".format(
+            major_version, archive_name)
+        sums_url = "https://www.kernel.org/pub/linux/kernel/v{}.x/{}".format(
+            major_version, "sha256sums.asc")
+        archive_path = "{}/{}".format(self.src_dir, archive_name)
+        manifest = self.cache_dir + "/kernels.json"
+        # The path only comes back if it still matches its recorded checksum.
+        cached_path = cache.lookup(manifest, archive_name)
 
         if os.path.isfile(archive_path):
-            return True
-        return False
+            if expected_sha256 is None and cached_path == archive_path:
+                logging.info("Loading cached tarball.")
+            else:
+                if expected_sha256 is None:
+                    expected_sha256 = download.published_sha256(
+                        sums_url, archive_name)
+                if expected_sha256 and cache.verify(archive_path,
+                                                    expected_sha256):
+                    logging.info("Loading cached tarball (sha256 OK).")
+                elif expected_sha256:
+                    logging.info("Cached Linux kernel is incomplete. "
+                                 "Downloading it again.")
+                    os.unlink(archive_path)
+
+        if not os.path.isfile(archive_path):
+            cached_path = None
+            logging.info("Downloading the Linux kernel.")
+            download.file(url, archive_path)
+
+            if not os.path.isfile(archive_path):
+                return False
+
+            if expected_sha256 is None:
+                expected_sha256 = download.published_sha256(
+                    sums_url, archive_name)
+            if expected_sha256 and not cache.verify(archive_path,
+                                                    expected_sha256):
+                os.unlink(archive_path)
+                prettify.error_message(
+                    "The downloaded Linux kernel does not match its checksum.")
+                return False
+
+        if cache_artifacts and cached_path != archive_path:
+            logging.debug('Caching "%s".', archive_path)
+            cache.record(manifest, archive_name, archive_path)
+
+        return True
 
     def extract(self):
         """Extract the Linux kernel.
@@ -85,18 +139,23 @@ class CompilationSpeed:
             return True
         return False
 
-    def setup(self, cores=None, cflags=None):
+    def setup(self, cores=None, cflags=None, cache_artifacts=True):
         """Setup the Linux kernel config file.
 
+        Generated config files are cached by kernel version and CFLAGS, so
+        `make defconfig` only runs once per combination.
+
         Args:
             cores (int, optional): The number of cores on the system.
             cflags (str, optional): The CFLAGS for GCC.
+            cache_artifacts (bool, optional): Whether to use the artifact
+                cache.
 
         Returns:
             Boolean: True if setup was successful otherwise False.
         """
         if cores is None:
-            cores = 1
+            cores = cpu.recommended_j()
         if cflags is None:
             cflags = "-march=native -mtune=native"
 
@@ -104,6 +163,9 @@ class CompilationSpeed:
         shell_env = os.environ.copy()
         if "-O" not in cflags:
             cflags += " -O3 "
+        if "-pipe" not in cflags:
+            cflags += " -pipe "
+        logging.info("Linux kernel CFLAGS: %s", cflags)
         shell_env["CFLAGS"] = cflags
 
         if os.path.isfile(config_loc):
@@ -115,6 +177,20 @@ class CompilationSpeed:
                 " found.".format(self.kernel_dir))
             return False
 
+        config_key = hashlib.sha256(
+            (self.version + cflags + "defconfig").encode()).hexdigest()
+        cached_config = "{}/kconfig/{}/.config".format(self.cache_dir,
+                                                       config_key)
+
+        if cache_artifacts and os.path.isfile(cached_config):
+            hours = (time.time() - os.path.getmtime(cached_config)) / 3600
+            logging.info("Loading cached .config built %.1fh ago.", hours)
+            shutil.copyfile(cached_config, config_loc)
+            self.commands.append("Setup: CFLAGS = " + cflags)
+            self.commands.append("Setup: cp {} {}".format(
+                cached_config, config_loc))
+            return os.path.isfile(config_loc)
+
         logging.info(
             "Setting up the Linux kernel with %d Make threads, "
             'and "%s" CFLAGS.',
@@ -134,43 +210,142 @@ class CompilationSpeed:
         self.commands.append("Setup: " + cmd)
 
         if os.path.isfile(config_loc):
+            if cache_artifacts:
+                os.makedirs(os.path.dirname(cached_config), exist_ok=True)
+                shutil.copyfile(config_loc, cached_config)
             return True
         return False
 
-    def run(self, cores=None, cflags=None):
+    def __clean(self, clean_cmd, shell_env):
+        """Clean the Linux kernel tree before a timed compilation.
+
+        Args:
+            clean_cmd (str): The command to clean the tree.
+            shell_env (dict): The shell environment exports.
+        """
+        with self.__tree_lock:
+            execute.output(clean_cmd, self.kernel_dir, environment=shell_env)
+
+    @staticmethod
+    def __settle(cold_cache):
+        """Wait for the system to be quiet before a timed compilation.
+
+        Args:
+            cold_cache (bool): Drop the caches and wait for the system to
+                settle, otherwise only wait for dirty writeback.
+        """
+        if cold_cache:
+            optimize.prerun()
+            time.sleep(10)
+        else:
+            time.sleep(1)
+
+    def __measure(self, build_cmd, shell_env):
+        """Time a compilation of the Linux kernel tree.
+
+        Args:
+            build_cmd (str): The command to compile the tree.
+            shell_env (dict): The shell environment exports.
+
+        Returns:
+            Float: The compilation time, otherwise None.
+        """
+        with self.__tree_lock:
+            return execute.timed(build_cmd,
+                                 working_dir=self.kernel_dir,
+                                 environment=shell_env)
+
+    def __perf_warm_runs(self, build_cmd, prep_cmd, shell_env):
+        """Time two warm compilations with a single `perf stat` call.
+
+        Args:
+            build_cmd (str): The command to compile the tree.
+            prep_cmd (str): The command run before each compilation.
+            shell_env (dict): The shell environment exports.
+
+        Returns:
+            List: The two compilation times, otherwise None.
+        """
+        perf_cmd = 'perf stat --null -r 2 --pre "{}" {}'.format(
+            prep_cmd, build_cmd)
+        self.commands.append("Run - Warm: " + perf_cmd)
+
+        with self.__tree_lock:
+            output = execute.output(perf_cmd,
+                                    working_dir=self.kernel_dir,
+                                    environment=shell_env)
+
+        warm_runs = execute.perf_runs(output)
+        if warm_runs is None:
+            logging.debug("perf stat output:\n%s", output)
+        return warm_runs
+
+    def run(self,
+            cores=None,
+            cflags=None,
+            mode="cold",
+            cold_cache_every_run=False):
         """Run three timed Linux kernel compilations.
 
+        In "cold" mode every run is a full rebuild after `make clean`. In
+        "warm" mode only the first run is a full rebuild; the other two keep
+        the object tree and rebuild the `kernel/` subsystem, which measures
+        steady-state incremental compile throughput. When `perf` is
+        available, both warm runs are timed by one `perf stat` repeat.
+
+        Caches are only dropped before the first run unless
+        `cold_cache_every_run` is set; later runs just wait a second for
+        dirty pages to be written back.
+
         Args:
             cores (int, optional): The number of cores on the system.
+            cflags (str, optional): The CFLAGS for GCC.
+            mode (str, optional): Either "cold" or "warm".
+            cold_cache_every_run (bool, optional): Drop caches and wait for
+                the system to settle before every run.
 
         Returns:
-            If success, a dict containing (unit, run1, run2, run3, average,
-            median).
+            If success, a dict containing (unit, mode, run1, run2, run3,
+            cold_run, warm_runs, average, median, variance, range).
 
                 unit (str): Score units.
+                mode (str): The compilation mode.
                 run1 (float): Score for the first run.
                 run2 (float): Score for the second run.
                 run3 (float): Score for the third run.
-                average (float): Average of run1, run2, and run3.
-                median (float): Median of run1, run2, and run3.
+                cold_run (float): Score for the full rebuild in warm mode.
+                warm_runs (list): Scores for the incremental rebuilds in warm
+                    mode.
+                average (float): Average of run1, run2, and run3, or of the
+                    warm runs in warm mode.
+                median (float): Median of run1, run2, and run3, or of the
+                    warm runs in warm mode.
 
             Else, a dict containing (error).
 
                 error (str): Error message.
         """
         if cores is None:
-            cores = 1
+            cores = cpu.recommended_j()
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if "-O" not in cflags:
             cflags += " -O3 "
+        if "-pipe" not in cflags:
+            cflags += " -pipe "
+        logging.info("Linux kernel CFLAGS: %s", cflags)
         shell_env = os.environ.copy()
         shell_env["CFLAGS"] = cflags
 
-        results = {"unit": "s"}
+        results = {"unit": "s", "mode": mode}
         config_loc = self.kernel_dir + "/.config"
         tmp_results = []
 
+        if mode not in ("cold", "warm"):
+            text = 'Unknown Linux kernel compilation mode "{}".'.format(mode)
+            prettify.error_message(text)
+            return {"error": text}
+
         if not os.path.isfile(config_loc):
             text = ('Cannot run timed Linux kernel because "{}" could not '
                     "be found.".format(config_loc))
@@ -178,49 +353,87 @@ class CompilationSpeed:
             return {"error": text}
 
         logging.info(
-            "Running timed Linux kernel compilation using %d Make "
-            "thread.", cores)
+            "Running %s timed Linux kernel compilation using %d Make "
+            "thread.", mode, cores)
 
         os.makedirs(self.results_dir, exist_ok=True)
 
         clean_cmd = "make -s -j {} clean".format(cores)
-        build_cmd = "make -s -j {}".format(cores)
+        # Synchronized output keeps interleaved errors from slowing the build.
+        build_cmd = "make -s -j {} --output-sync=target".format(cores)
         self.commands.append("Run: CFLAGS = " + cflags)
+        # Deleting the objects of one subsystem forces a representative
+        # incremental rebuild and relink without touching the rest of the tree.
+        warm_cmd = "find kernel -name '*.o' -delete"
         self.commands.append("Prerun: " + clean_cmd)
+        if mode == "warm":
+            self.commands.append("Prerun - Warm: " + warm_cmd)
         self.commands.append("Run: " + build_cmd)
 
-        for count in range(1, 4):
-            run_num = "run" + str(count)
-            result_file = "{}/zlib_{}.txt".format(self.results_dir, run_num)
+        use_perf = mode == "warm" and shutil.which("perf") is not None
+        runs = 1 if use_perf else 3
 
-            execute.output(clean_cmd, self.kernel_dir, environment=shell_env)
+        # Cleaning is not part of the measurement, so the tree for the next
+        # run is cleaned while the current run's results are recorded.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            cleaning = executor.submit(self.__clean, clean_cmd, shell_env)
 
-            optimize.prerun()
-            time.sleep(10)
+            for count in range(1, runs + 1):
+                run_num = "run" + str(count)
+                result_file = "{}/zlib_{}.txt".format(self.results_dir, run_num)
 
-            compile_speed = execute.timed(build_cmd,
-                                          working_dir=self.kernel_dir,
-                                          environment=shell_env)
+                cleaning.result()
 
-            if (not os.path.isfile(self.kernel_dir + "/vmlinux") or
-                    compile_speed is None):
-                return {"error": "Linux Kernel failed to compile."}
+                self.__settle(count == 1 or cold_cache_every_run)
+
+                compile_speed = self.__measure(build_cmd, shell_env)
+
+                if (not os.path.isfile(self.kernel_dir + "/vmlinux") or
+                        compile_speed is None):
+                    return {"error": "Linux Kernel failed to compile."}
 
-            file.write(
-                result_file,
-                "{}\nLinux Kernel Compilation Speed:  {}\n".format(
-                    build_cmd, compile_speed),
-            )
+                if count < runs:
+                    prep_cmd = warm_cmd if mode == "warm" else clean_cmd
+                    cleaning = executor.submit(self.__clean, prep_cmd,
+                                               shell_env)
+
+                file.write(
+                    result_file,
+                    "{}\nLinux Kernel Compilation Speed:  {}\n".format(
+                        build_cmd, compile_speed),
+                )
+
+                results[run_num] = float(compile_speed)
+                tmp_results.append(compile_speed)
+
+        if use_perf:
+            self.__settle(cold_cache_every_run)
+
+            warm_runs = self.__perf_warm_runs(build_cmd, warm_cmd, shell_env)
+
+            if warm_runs is None:
+                return {"error": "Linux Kernel failed to compile."}
 
-            results[run_num] = float(compile_speed)
-            tmp_results.append(compile_speed)
+            for count, compile_speed in enumerate(warm_runs, start=2):
+                run_num = "run" + str(count)
+                file.write(
+                    "{}/zlib_{}.txt".format(self.results_dir, run_num),
+                    "{}\nLinux Kernel Compilation Speed:  {}\n".format(
+                        build_cmd, compile_speed),
+                )
+                results[run_num] = compile_speed
+                tmp_results.append(compile_speed)
+
+        if mode == "warm":
+            results["cold_run"] = tmp_results[0]
+            results["warm_runs"] = tmp_results[1:]
+            tmp_results = tmp_results[1:]
 
         if tmp_results:
             results["average"] = statistics.mean(tmp_results)
             results["median"] = statistics.median(tmp_results)
             results["variance"] = statistics.variance(tmp_results)
-            sorted_results = sorted(tmp_results)
-            results["range"] = sorted_results[-1] - sorted_results[0]
+            results["range"] = max(tmp_results) - min(tmp_results)
 
         logging.info("Timed Linux kernel compilation results:\n%s",
                      str(results))
@@ -4,22 +4,45 @@
 This module handles the downloading, extracting, setting up, and running
 Docker.
 """
+import concurrent.futures
+import http.client
+import json
 import logging
 import os
 import shutil
+import socket
 import statistics
 import subprocess
 import time
 
+from spet.lib.utilities import cache
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
 from spet.lib.utilities import file
-from spet.lib.utilities import grep
 from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
 
 
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a UNIX socket.
+
+    Args:
+        sock_file (str): The UNIX socket to connect to.
+        timeout (int, optional): The socket timeout in seconds.
+    """
+
+    def __init__(self, sock_file, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.sock_file = sock_file
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.sock_file)
+
+
 class Docker:
     """Docker benchmarking.
 
@@ -36,8 +59,12 @@ class Docker:
         src_dir (str): The source directory for installing packages.
         docker_dir (str): The source directory for the Docker.
         docker_dir (str): The data directory for the Docker.
+        cache_dir (str): The directory for artifacts reused between runs.
+        pid_file (str): The PID file for the Docker daemon.
+        sock_file (str): The UNIX socket of the Docker daemon.
         results_dir (str): The results directory for the Docker results.
         commands (list): All major commands run for Docker.
+        daemon_running (bool): Whether the Docker daemon has been started.
     """
 
     def __init__(self, version, root_dir, results_dir):
@@ -45,29 +72,67 @@ class Docker:
         self.src_dir = root_dir + "/src"
         self.docker_dir = self.src_dir + "/docker"
         self.data_dir = self.docker_dir + "/data"
+        self.cache_dir = self.src_dir + "/.cache"
+        self.pid_file = "/tmp/docker.pid"
+        self.sock_file = "/var/run/docker.sock"
         self.results_dir = results_dir + "/docker"
         self.commands = []
+        self.daemon_running = False
+        self.__image_cache = {}
+
+    def __enter__(self):
+        self.start_daemon()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_daemon()
 
-    def download(self):
+    def download(self, expected_sha256=None):
         """Download Docker.
 
+        An archive left by an earlier run is only reused if it matches
+        `expected_sha256`, or the checksum recorded when it was downloaded,
+        so a truncated download is fetched again.
+
+        Args:
+            expected_sha256 (str, optional): The archive's checksum.
+
         Returns:
             Boolean: True if download was successful otherwise False.
         """
         archive_name = "docker-{}-ce.tgz".format(self.version)
         archive_path = "{}/{}".format(self.src_dir, archive_name)
+        manifest = self.cache_dir + "/docker.json"
 
         if os.path.isfile(archive_path):
-            return True
+            if expected_sha256 is not None:
+                if cache.verify(archive_path, expected_sha256):
+                    logging.info("Loading cached tarball (sha256 OK).")
+                    return True
+            elif cache.lookup(manifest, archive_name) == archive_path:
+                # Without a recorded checksum the archive may be truncated.
+                logging.info("Loading cached tarball.")
+                return True
+            logging.info("Cached Docker is incomplete. Downloading it again.")
+            os.unlink(archive_path)
 
         url = "https://download.docker.com/linux/static/stable/x86_64/" + archive_name
 
         logging.info("Downloading Docker Community Edition.")
         download.file(url, archive_path)
 
-        if os.path.isfile(archive_path):
-            return True
-        return False
+        if not os.path.isfile(archive_path):
+            return False
+
+        if expected_sha256 is not None and not cache.verify(
+                archive_path, expected_sha256):
+            os.unlink(archive_path)
+            prettify.error_message(
+                "The downloaded Docker does not match its checksum.")
+            return False
+
+        cache.record(manifest, archive_name, archive_path)
+        return True
 
     def extract(self):
         """Extract Docker.
@@ -95,6 +160,141 @@ class Docker:
             return True
         return False
 
+    def __wait_for_daemon(self, env, timeout=30):
+        """Wait until the Docker daemon answers requests.
+
+        Args:
+            env (dict): The shell environment exports.
+            timeout (int, optional): The maximum seconds to wait.
+
+        Returns:
+            Boolean: True if the daemon is ready otherwise False.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with socket.socket(socket.AF_UNIX) as client:
+                    client.connect(self.sock_file)
+                info = subprocess.run(
+                    [self.docker_dir + "/docker", "info"],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=max(1, deadline - time.time()),
+                    check=False,
+                )
+                if info.returncode == 0:
+                    return True
+            except (OSError, subprocess.TimeoutExpired) as err:
+                logging.debug(err)
+            time.sleep(0.1)
+        return False
+
+    def start_daemon(self):
+        """Start the Docker daemon unless it is already running.
+
+        The daemon is shared by `build` and `run`, so it only has to be
+        started once per SPET run.
+
+        Returns:
+            Boolean: True if the daemon is running otherwise False.
+        """
+        if self.daemon_running:
+            return True
+
+        if not os.path.isfile(self.docker_dir + "/dockerd"):
+            prettify.error_message("Cannot start Docker. Docker directory not "
+                                   "found.")
+            return False
+
+        shell_env = os.environ.copy()
+        shell_env["PATH"] = self.docker_dir + ":" + shell_env["PATH"]
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        logging.debug("Starting Docker daemon.")
+        subprocess.Popen(
+            "{}/dockerd --pidfile {} --data-root {} &".format(
+                self.docker_dir, self.pid_file, self.data_dir),
+            cwd=self.docker_dir,
+            shell=True,
+            env=shell_env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        self.daemon_running = self.__wait_for_daemon(shell_env)
+        if not self.daemon_running:
+            prettify.error_message("The Docker daemon failed to start.")
+            self.stop_daemon()
+            return False
+
+        logging.info("Docker daemon is running.")
+        return True
+
+    def stop_daemon(self):
+        """Stop the Docker daemon."""
+        if os.path.exists(self.pid_file):
+            logging.info("Docker daemon is turning off.")
+            pid = file.read(self.pid_file).strip()
+            execute.terminate(pid)
+        self.daemon_running = False
+
+    def __api(self, method, path):
+        """Send a request to the Docker Engine API.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The API endpoint.
+
+        Returns:
+            The decoded JSON response, otherwise None.
+
+        Raises:
+            HTTPException: If the daemon rejects the request.
+        """
+        connection = _UnixHTTPConnection(self.sock_file)
+        try:
+            connection.request(method, path)
+            response = connection.getresponse()
+            body = response.read()
+            if response.status >= 400:
+                raise http.client.HTTPException("{} {}: {} {}".format(
+                    method, path, response.status, body))
+            if body:
+                return json.loads(body.decode())
+            return None
+        finally:
+            connection.close()
+
+    def __remove_containers(self, env):
+        """Stop and remove all containers.
+
+        Uses the Docker Engine API and falls back to the `docker` client if
+        the daemon's socket cannot be reached.
+
+        Args:
+            env (dict): The shell environment exports.
+        """
+        try:
+            containers = self.__api("GET", "/containers/json?all=1")
+            if not containers:
+                return
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(32, len(containers))) as executor:
+                list(
+                    executor.map(
+                        lambda container: self.__api(
+                            "DELETE", "/containers/{}?force=1".format(container[
+                                "Id"])), containers))
+        except (OSError, ValueError, http.client.HTTPException) as err:
+            logging.debug(err)
+            execute.output(
+                "{0}/docker rm -f $({0}/docker ps -a -q)".format(
+                    self.docker_dir),
+                working_dir=self.docker_dir,
+                environment=env,
+            )
+
     def __image_built(self, name, env=None):
         """Check if the named image is built.
 
@@ -108,40 +308,82 @@ class Docker:
         Returns:
             Boolean: True if image found otherwise False.
         """
+        if name in self.__image_cache:
+            return self.__image_cache[name]
+
         if env is None:
             env = os.environ.copy()
             env["PATH"] = self.docker_dir + ":" + env["PATH"]
 
         logging.debug("Checking if Docker image is built.")
-        image_output = execute.output("docker images",
-                                      working_dir=self.docker_dir,
-                                      environment=env)
-        found_images = grep.text(image_output, name)
+        inspect = subprocess.run(
+            [self.docker_dir + "/docker", "image", "inspect", name],
+            cwd=self.docker_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
 
-        if found_images:
-            return True
-        return False
+        self.__image_cache[name] = inspect.returncode == 0
+        return self.__image_cache[name]
+
+    def __run_container(self, run_command, env):
+        """Run a container and parse its compile time.
+
+        Args:
+            run_command (str): The `docker run` command.
+            env (dict): The shell environment exports.
+
+        Returns:
+            Float: The compile time, otherwise None.
+        """
+        proc = subprocess.Popen(
+            run_command,
+            shell=True,
+            cwd=self.docker_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        stdout = proc.communicate()[0]
+        if isinstance(stdout, bytes):
+            stdout = stdout.decode()
+        stdout = stdout.strip()
+        try:
+            return float(stdout)
+        except ValueError:
+            logging.debug("Container failed to finish.")
+            logging.debug(stdout)
+            return None
 
-    def build(self, linux_ver, cores=None, cflags=None):
+    def build(self, linux_ver, cores=None, cflags=None, cache_artifacts=True):
         """Builds the image for Docker to compile the Linux kernel.
 
+        If the Linux kernel archive was cached by the compilation benchmark,
+        it is copied into the image instead of being downloaded again.
+
         Args:
             linux_ver (str): The Linux kernel version.
             cores (int, optional): The number of Make cores.
             cflags (str, optional): The CFLAGS for GCC.
+            cache_artifacts (bool, optional): Whether to use the artifact
+                cache.
 
         Returns:
             Boolean: True if build was successful otherwise False.
         """
         if cores is None:
-            cores = 1
+            cores = cpu.recommended_j()
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if "-O" not in cflags:
             cflags += " -O3 "
+        if "-pipe" not in cflags:
+            cflags += " -pipe "
+        logging.info("Linux kernel CFLAGS: %s", cflags)
 
         built = False
-        pid_file = "/tmp/docker.pid"
         build_name = "compile_kernel"
         dockerfile = self.docker_dir + "/Dockerfile"
 
@@ -150,8 +392,13 @@ class Docker:
         shell_env["CFLAGS"] = cflags
 
         major_version = linux_ver.split(".")[0]
-        url = ("http://www.kernel.org/pub/linux/kernel/v{}.x/"
-               "linux-{}.tar.gz").format(major_version, linux_ver)
+        archive_name = "linux-{}.tar.gz".format(linux_ver)
+        url = "http://www.kernel.org/pub/linux/kernel/v{}.x/{}".format(
+            major_version, archive_name)
+        cached_archive = None
+        if cache_artifacts:
+            cached_archive = cache.lookup(self.cache_dir + "/kernels.json",
+                                          archive_name)
         build_cmd = (
             'docker build --build-arg cores={} --build-arg cflags="{}" '
             "--ulimit nofile=1048576:1048576 --build-arg url={} "
@@ -159,36 +406,43 @@ class Docker:
                                                      linux_ver, build_name,
                                                      self.docker_dir))
 
+        # BuildKit is only available from Docker 18.09 onwards.
+        if tuple(int(num) for num in self.version.split(".")[:2]) >= (18, 9):
+            shell_env["DOCKER_BUILDKIT"] = "1"
+            build_cmd = build_cmd.replace("docker build ",
+                                          "docker build --progress=plain ")
+
         self.commands.append("Build: " + build_cmd)
 
         if not os.path.isfile(self.docker_dir + "/dockerd"):
             prettify.error_message("Cannot build. Docker directory not found.")
             return False
 
-        os.makedirs(self.data_dir, exist_ok=True)
-
-        # Start Docker daemon
-        logging.debug("Starting Docker daemon.")
-        subprocess.Popen(
-            "{}/dockerd --pidfile {} --data-root {} &".format(
-                self.docker_dir, pid_file, self.data_dir),
-            cwd=self.docker_dir,
-            shell=True,
-            env=shell_env,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        time.sleep(20)
+        owns_daemon = not self.daemon_running
+        if not self.start_daemon():
+            return False
 
         # Make sure Docker has enough IPs available to assign to containers
         if shutil.which("ifconfig"):
             execute.output(
                 "ifconfig docker0 down && ifconfig docker0 172.17.0.1/16 up")
 
-        if not os.path.isfile(dockerfile):
-            shutil.copyfile(self.src_dir + "/provided/Dockerfile", dockerfile)
+        dockerfile_text = file.read(self.src_dir + "/provided/Dockerfile")
+        if cached_archive:
+            logging.debug('Using cached "%s" for the Docker image.',
+                          cached_archive)
+            context_archive = self.docker_dir + "/" + archive_name
+            if not os.path.isfile(context_archive):
+                try:
+                    os.link(cached_archive, context_archive)
+                except OSError:
+                    shutil.copyfile(cached_archive, context_archive)
+            dockerfile_text = dockerfile_text.replace(
+                "ADD ${url} /", "COPY linux-${version}.tar.gz /")
+        file.write(dockerfile, dockerfile_text)
 
         if not self.__image_built(build_name, env=shell_env):
+            self.__image_cache.pop(build_name, None)
             build_output = execute.output(build_cmd,
                                           working_dir=self.docker_dir,
                                           environment=shell_env)
@@ -198,25 +452,31 @@ class Docker:
             logging.info("Docker image built.")
             built = True
 
-        # Stop Docker daemon
-        if os.path.exists(pid_file):
-            logging.debug("Stopping Docker daemon.")
-            pid = file.read(pid_file).strip()
-            execute.kill(pid)
-            execute.kill(pid)
-            time.sleep(5)
+        if owns_daemon:
+            self.stop_daemon()
 
         return built
 
-    def run(self, cores=None, cflags=None):
+    def run(self, cores=None, cflags=None, concurrency=None):
         """Runs Docker containers to compile the Linux kernel.
 
+        Args:
+            cores (int, optional): The number of Make cores per container.
+            cflags (str, optional): The CFLAGS for GCC.
+            concurrency (int, optional): The maximum number of containers
+                running at once. Defaults to the usable CPU count divided by
+                `cores` so the host is not oversubscribed.
+
         Returns:
-            If success, a dict containing (unit, times, average, median,
-                variance, range).
+            If success, a dict containing (unit, cold_time, times, average,
+                median, variance, range).
 
                 unit (str): Score units.
-                times (list): All compile times for the kernel.
+                cold_time (float): Compile time of the first container, which
+                    fills the shared ccache emptied at the start of the run.
+                times (list): Compile times for the kernel with a warm
+                    ccache. These mostly time ccache hits, so they do not
+                    compare with full compiles.
                 average (float): Average of the times.
                 median (float): Median of the times.
                 variance (float): Variance of the times.
@@ -226,22 +486,26 @@ class Docker:
 
                 error (str): Error message.
         """
-        if cores is None:
-            cores = 1
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if "-O" not in cflags:
             cflags += " -O3 "
+        if "-pipe" not in cflags:
+            cflags += " -pipe "
+        logging.info("Linux kernel CFLAGS: %s", cflags)
+        if cores is None:
+            cores = 1
+        if concurrency is None:
+            concurrency = max(1, cpu.count() // cores)
         shell_env = os.environ.copy()
         shell_env["CFLAGS"] = cflags
         shell_env["PATH"] = self.docker_dir + ":" + shell_env["PATH"]
 
-        pid_file = "/tmp/docker.pid"
         build_name = "compile_kernel"
         result_file = self.results_dir + "/times.txt"
         results = {"unit": "s"}
         times = []
-        procs = []
+        run_commands = []
 
         os.makedirs(self.results_dir, exist_ok=True)
         shutil.copyfile(self.docker_dir + "/Dockerfile",
@@ -252,23 +516,13 @@ class Docker:
             prettify.error_message(message)
             return {"error": message}
 
-        # Start Docker daemon
-        subprocess.Popen(
-            "{}/dockerd --pidfile {} --data-root {} &".format(
-                self.docker_dir, pid_file, self.data_dir),
-            cwd=self.docker_dir,
-            shell=True,
-            env=shell_env,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        logging.info("Docker daemon is running.")
-        time.sleep(20)
+        owns_daemon = not self.daemon_running
+        if not self.start_daemon():
+            return {"error": "The Docker daemon failed to start."}
 
         if not self.__image_built(build_name, env=shell_env):
-            if os.path.exists(pid_file):
-                pid = file.read(pid_file).strip()
-                execute.kill(pid)
+            if owns_daemon:
+                self.stop_daemon()
             message = "Cannot build. Docker image not found."
             prettify.error_message(message)
             return {"error": message}
@@ -276,98 +530,69 @@ class Docker:
         logging.info("Docker is about to run.")
 
         # Remove all previously ran containers
-        try:
-            containers = execute.output(
-                "{}/docker ps -a -q".format(self.docker_dir),
-                working_dir=self.docker_dir,
-                environment=shell_env,
-            )
-            if containers:
-                execute.output(
-                    "{0}/docker rm $({0}/docker ps -a -q)".format(
-                        self.docker_dir),
-                    working_dir=self.docker_dir,
-                    environment=shell_env,
-                )
-        except subprocess.SubprocessError as err:
-            logging.debug(err)
+        self.__remove_containers(shell_env)
 
         optimize.prerun()
         time.sleep(10)
 
+        # Every container shares one ccache so only the first compiles the
+        # kernel from scratch. It is emptied on every run so the first
+        # container really is cold, and kept out of the build context so it
+        # is not sent to the daemon.
+        ccache_dir = self.src_dir + "/docker-ccache"
+        shutil.rmtree(ccache_dir, ignore_errors=True)
+        os.makedirs(ccache_dir)
+        self.commands.append(
+            "Run - Note: containers share the ccache in {}, emptied before "
+            "the first container; only cold_time is a full compile, the other "
+            "times are ccache hits and do not compare with runs without a "
+            "shared ccache.".format(ccache_dir))
+
         for count in range(0, 100):
             test_name = build_name + "_test{}".format(count)
             # Note: We avoid using `-i -t` because it causes TTY issues
             #       with SSH connections.
             run_command = ("{}/docker run --ulimit nofile=1048576:1048576 "
+                           "-v {}:/root/.ccache "
                            '-e "cores={}" -e "cflags={}" --name {} {}'.format(
-                               self.docker_dir, cores, cflags, test_name,
-                               build_name))
+                               self.docker_dir, ccache_dir, cores, cflags,
+                               test_name, build_name))
             if count == 0:
                 self.commands.append("Run: " + run_command)
+            run_commands.append(run_command)
 
-            proc = subprocess.Popen(
-                run_command,
-                shell=True,
-                cwd=self.docker_dir,
-                env=shell_env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-            )
-            procs.append(proc)
+        # The first container populates the ccache, so it is timed on its own.
+        cold_time = self.__run_container(run_commands.pop(0), shell_env)
+        if cold_time is not None:
+            results["cold_time"] = cold_time
 
-        for proc in procs:
-            stdout = proc.communicate()[0]
-            if isinstance(stdout, bytes):
-                stdout = stdout.decode()
-            stdout = stdout.strip()
-            try:
-                stdout = float(stdout)
-                file.write(result_file, "{}\n".format(stdout), append=True)
-                times.append(stdout)
-            except ValueError:
-                logging.debug("Container failed to finish.")
-                logging.debug(stdout)
+        logging.info("Running %d containers at a time.", concurrency)
 
-        # Remove all previously ran containers
-        try:
-            containers = execute.output(
-                "{}/docker ps -a -q".format(self.docker_dir),
-                working_dir=self.docker_dir,
-                environment=shell_env,
-            )
-            if containers:
-                execute.output(
-                    "{0}/docker stop $({0}/docker ps -a -q)".format(
-                        self.docker_dir),
-                    working_dir=self.docker_dir,
-                    environment=shell_env,
-                )
-                execute.output(
-                    "{0}/docker rm $({0}/docker ps -a -q)".format(
-                        self.docker_dir),
-                    working_dir=self.docker_dir,
-                    environment=shell_env,
-                )
-        except subprocess.SubprocessError as err:
-            logging.debug(err)
+        # Collect containers in the order they finish so a slow container
+        # does not hold up the rest.
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(self.__run_container, run_command, shell_env)
+                for run_command in run_commands
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                container_time = future.result()
+                if container_time is not None:
+                    times.append(container_time)
 
-        # Stop Docker daemon
-        if os.path.exists(pid_file):
-            logging.info("Docker daemon is turning off.")
-            pid = file.read(pid_file).strip()
-            execute.kill(pid)
-            execute.kill(pid)
-            time.sleep(5)
+        self.__remove_containers(shell_env)
+
+        if owns_daemon:
+            self.stop_daemon()
 
         if times:
+            file.write(result_file, "".join("{}\n".format(t) for t in times))
             results["times"] = times
             results["median"] = statistics.median(times)
             results["average"] = statistics.mean(times)
             results["variance"] = statistics.variance(times)
-            sorted_times = sorted(times)
-            results["range"] = sorted_times[-1] - sorted_times[0]
+            results["range"] = max(times) - min(times)
         else:
             results["error"] = "No container times available."
 
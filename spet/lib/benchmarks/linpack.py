@@ -7,20 +7,28 @@ and running HPL.
 
 import collections
 import filecmp
+import functools
 import logging
-import math
 import os
+import re
 import shutil
-import time
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
 from spet.lib.utilities import file
-from spet.lib.utilities import grep
 from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
 
+# HPL.dat lines. The repeated groups cannot overlap, so they never backtrack.
+N_COUNT_PATTERN = re.compile(r"\d+\s+# of problems sizes \(N\)")
+NS_PATTERN = re.compile(r"(?:\d+\s+)+Ns")
+NBS_PATTERN = re.compile(r"(?:\d+\s+)+NBs")
+GRID_COUNT_PATTERN = re.compile(r"\d+\s+# of process grids \(P x Q\)")
+PS_PATTERN = re.compile(r"(?:\d+\s+)+Ps")
+QS_PATTERN = re.compile(r"(?:\d+\s+)+Qs")
+
 
 class Linpack:
     """High-Performance Linpack (HPL) benchmarking.
@@ -92,13 +100,40 @@ class Linpack:
             return False
 
         logging.info("Extracting High-Performance Linpack.")
-        extract.tar(file_path, self.src_dir)
-        os.rename("{}-{}".format(self.hpl_dir, self.version), self.hpl_dir)
+        extract.tar_stripped(file_path, self.hpl_dir,
+                             "hpl-{}/".format(self.version))
 
         if os.path.exists(self.hpl_dir):
             return True
         return False
 
+    @staticmethod
+    def __compiler(mpicc_bin):
+        """The compiler wrapped by `mpicc`.
+
+        Args:
+            mpicc_bin (str): The path to `mpicc`.
+
+        Example:
+            >>> __compiler("/src/openmpi/build/bin/mpicc")
+            ('gcc', 9)
+
+        Returns:
+            Tuple: The compiler name ("gcc", "icc", "clang", or None) and its
+                major version.
+        """
+        output = execute.output(mpicc_bin + " --version") or ""
+        first_line = output.strip().split("\n")[0]
+        match = re.search(r"(\d+)\.\d+", first_line)
+        major = int(match.group(1)) if match else 0
+        if first_line.startswith("icc"):
+            return "icc", major
+        if first_line.startswith("gcc"):
+            return "gcc", major
+        if "clang" in first_line:
+            return "clang", major
+        return None, major
+
     def edit_makefile(self, processor, arch=None, cflags=None, avx512=None):
         """Edits the provided HPL Makefile with values for this system.
 
@@ -106,8 +141,8 @@ class Linpack:
             processor (str): The processor name for the system.
             arch (str, optional): The architecture type of the system.
             cflags (str, optional): The CFLAGS for GCC.
-            avx512 (bool, optional): If AVX-512 instructions should be added to
-                                     the CFLAGS.
+            avx512 (bool, optional): If the AVX-512 instructions supported by
+                                     this CPU should be added to the CFLAGS.
 
         Returns:
             Boolean: True if edit was successful otherwise False.
@@ -116,9 +151,26 @@ class Linpack:
             arch = "x86_64"
         if cflags is None:
             cflags = "-march=native -mtune=native"
+        compiler, major = self.__compiler(self.src_dir +
+                                          "/openmpi/build/bin/mpicc")
+        if compiler != "icc":
+            if "-O" not in cflags:
+                cflags += " -O3 "
+            # Let the compiler vectorize and unroll HPL's own loops, such as
+            # the row swaps, instead of leaving all SIMD to the BLAS.
+            cflags += (" -funroll-loops -ftree-vectorize -ffast-math"
+                       " -fopenmp-simd ")
+        if compiler == "gcc":
+            cflags += " -malign-data=cacheline "
         if avx512 is True:
-            cflags += (" -mavx512f -mavx512cd -mavx512bw -mavx512dq -mavx512vl"
-                       " -mavx512ifma -mavx512vbmi ")
+            # Both compilers prefer 256-bit vectors on AVX-512 CPUs unless
+            # told otherwise, leaving half of each ZMM register unused.
+            if compiler == "icc":
+                cflags += " -O3 -xCORE-AVX512 -qopt-zmm-usage=high -align "
+            else:
+                cflags += cpu.avx512_cflags()
+                if compiler == "gcc" and major >= 8:
+                    cflags += " -mprefer-vector-width=512 "
 
         blis_dir = "{}/blis".format(self.src_dir)
         mkl_dir = "/opt/intel/mkl"
@@ -131,6 +183,8 @@ class Linpack:
             makefile = "Make.amd"
             self.mathlib = "blis"
             mathlib_path = blis_dir
+            if compiler == "clang":
+                cflags += " -mllvm -inline-threshold=1000 "
         else:
             makefile = "Make.generic"
             self.mathlib = "openblas"
@@ -142,16 +196,10 @@ class Linpack:
         if os.path.exists(dest_make):
             return True
 
-        if not os.path.isfile(orig_make):
+        missing_path = file.missing([orig_make, self.hpl_dir])
+        if missing_path:
             text = ("Cannot edit HPL's Makefile because '{}' could "
-                    "not be found.".format(orig_make))
-            prettify.error_message(text)
-            logging.error(text)
-            return False
-
-        if not os.path.isdir(self.hpl_dir):
-            text = ("Cannot edit HPL's Makefile because '{}' could "
-                    "not be found.".format(self.hpl_dir))
+                    "not be found.".format(missing_path))
             prettify.error_message(text)
             logging.error(text)
             return False
@@ -163,7 +211,6 @@ class Linpack:
             cflags,
         )
 
-        file.touch(dest_make)
         shutil.copyfile(orig_make, dest_make)
 
         file.replace_line(dest_make, "ARCH         = x86_64",
@@ -175,6 +222,20 @@ class Linpack:
         file.replace_line(dest_make, "LAdir        =",
                           "LAdir        = " + mathlib_path)
 
+        if self.mathlib == "openblas":
+            # The OpenBLAS prerequisite is built with USE_OPENMP=1, not as a
+            # separate single-threaded variant. Its static archive is linked
+            # with libgomp, so HPL's OpenMP threads and OpenBLAS share one
+            # runtime, and OPENBLAS_NUM_THREADS=1 keeps BLAS serial per rank.
+            file.replace_line(
+                dest_make, r"^LAlib\s+=.*",
+                "LAlib        = $(LAdir)/libopenblas.a -lgomp "
+                "-lpthread")
+            self.commands.append(
+                "Build: LAlib = {}/libopenblas.a -lgomp -lpthread (OpenMP "
+                "OpenBLAS, single-threaded at run time with "
+                "OPENBLAS_NUM_THREADS=1)".format(mathlib_path))
+
         file.replace_line(
             dest_make,
             "CC           =",
@@ -195,8 +256,8 @@ class Linpack:
             arch (str, optional): The architecture type of the system.
             cores (int, optional): The number of cores on the system.
             cflags (str, optional): The CFLAGS for GCC.
-            avx512 (bool, optional): If AVX-512 instructions should be added to
-                                     the CFLAGS.
+            avx512 (bool, optional): If the AVX-512 instructions supported by
+                                     this CPU should be added to the CFLAGS.
 
         Returns:
             Boolean: True if compilation was successful otherwise False.
@@ -208,8 +269,7 @@ class Linpack:
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if avx512 is True:
-            cflags += (" -mavx512f -mavx512cd -mavx512bw -mavx512dq -mavx512vl"
-                       " -mavx512ifma -mavx512vbmi ")
+            cflags += cpu.avx512_cflags()
         if "-O" not in cflags:
             cflags += " -O3 "
 
@@ -223,23 +283,10 @@ class Linpack:
         if os.path.isfile(bin_file):
             return True
 
-        if not os.path.isdir(self.hpl_dir):
-            text = 'Cannot compile LINPACK because "{}" could not ' "be found.".format(
-                self.hpl_dir)
-            prettify.error_message(text)
-            logging.error(text)
-            return False
-
-        if not os.path.isfile(makefile):
+        missing_path = file.missing([makefile, mpicc_bin])
+        if missing_path:
             text = 'Cannot compile LINPACK because "{}" could not ' "be found.".format(
-                makefile)
-            prettify.error_message(text)
-            logging.error(text)
-            return False
-
-        if not os.path.isfile(mpicc_bin):
-            text = 'Cannot compile LINPACK because "{}" could not ' "be found.".format(
-                mpicc_bin)
+                missing_path)
             prettify.error_message(text)
             logging.error(text)
             return False
@@ -277,6 +324,30 @@ class Linpack:
         return False
 
     @staticmethod
+    def __isqrt(value):
+        """Exact integer square root, rounded down.
+
+        Args:
+            value (int): A non-negative integer.
+
+        Example:
+            >>> __isqrt(17)
+            4
+
+        Returns:
+            Integer: The largest integer whose square is at most `value`.
+        """
+        if value < 2:
+            return value
+        root = 1 << ((value.bit_length() + 1) // 2)
+        while True:
+            smaller = (root + value // root) // 2
+            if smaller >= root:
+                return root
+            root = smaller
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
     def __calculate_n(memory_gb, nb_size):
         """Calculate the problem size for LINPACK.
 
@@ -289,16 +360,15 @@ class Linpack:
         """
         if memory_gb < 1:
             memory_gb = 1
-        utilization = 0.8
-        memory_alignment = 8
-        memory_b = memory_gb * 1024 * 1024 * 1024
-        tmp = int(math.sqrt((utilization * memory_b) / memory_alignment))
+        memory_b = int(memory_gb * 1024 * 1024 * 1024)
+        # 80% utilization of 8 byte aligned memory, kept in integers so large
+        # memory sizes do not lose precision in a float.
+        n_size = Linpack.__isqrt(memory_b * 8 // 10 // 8)
         # for precision by nb_size
-        tmp = int(tmp / nb_size)
-        tmp = int(tmp * nb_size)
-        return tmp
+        return n_size // nb_size * nb_size
 
     @staticmethod
+    @functools.lru_cache(maxsize=128)
     def __scale_n(n_size, nb_size):
         """Scale the n_size to avoid memory allocation issues.
 
@@ -307,29 +377,32 @@ class Linpack:
             nb_size (int): Block size.
 
         Example:
-            >>> __scale_n(137706, 389)
-            [137, 1377, 13770, 137706]
+            >>> __scale_n(3840, 384)
+            (768, 1152, 1536, 2304, 3072, 3840)
 
         Returns:
-            List: All integer N sizes to scale.
+            Tuple: All integer N sizes to scale, so the cached result cannot
+                be modified by callers.
         """
+        # Each size is 1.25 times smaller than the last, rounded down to a
+        # multiple of nb_size. The rounding is applied step by step, as in
+        # earlier SPET runs, so the ladder stays comparable with them.
         n_sizes = [n_size]
         current = n_size
         while current > 1000:
-            current = int(current / 1.25)
-            current = int(current / nb_size)
-            current = int(current * nb_size)
-            n_sizes.append(int(current))
-        n_sizes = sorted(n_sizes)
+            current = int(current / 1.25) // nb_size * nb_size
+            n_sizes.append(current)
         # HPL won't allow > 20 N sizes
-        if len(n_sizes) > 20:
-            n_sizes = n_sizes[-20:]
-        return n_sizes
+        return tuple(sorted(n_sizes)[-20:])
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def __grid(mpi_threads):
         """Calculate the PxQ grid for LINPACK.
 
+        The grid is the most square factor pair of `mpi_threads`, so only
+        divisors up to its square root need to be checked.
+
         Args:
             mpi_threads (int): The number of MPI threads on the system.
 
@@ -340,22 +413,17 @@ class Linpack:
         Returns:
             NamedTuple: P and Q.
         """
-        i = 1
-        divisors = []
         grid = collections.namedtuple("grid", ["P", "Q"])
-        if mpi_threads < i:
+        if mpi_threads < 1:
             return None
-        while i <= mpi_threads:
+        best = (1, mpi_threads)
+        for i in range(1, Linpack.__isqrt(mpi_threads) + 1):
             if mpi_threads % i == 0:
-                divisors.append(i)
-            i = i + 1
-        half = len(divisors) / 2.0
-        middle = int(half)
-        if half % 1 == 0:
-            return grid(P=divisors[middle - 1], Q=divisors[-middle])
-        return grid(P=divisors[middle], Q=divisors[middle])
+                best = (i, mpi_threads // i)
+        return grid(P=best[0], Q=best[1])
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def __nb_size(threads):
         if threads >= 64:
             nb_size = 384
@@ -387,7 +455,10 @@ class Linpack:
 
         nb_size = self.__nb_size(threads)
 
-        if filecmp.cmp(orig_dat, dest_dat):
+        # Only compare contents when the sizes already match.
+        if (os.path.isfile(orig_dat) and os.path.isfile(dest_dat) and
+                os.path.getsize(orig_dat) == os.path.getsize(dest_dat) and
+                filecmp.cmp(orig_dat, dest_dat, shallow=False)):
             return True
 
         if not os.path.isfile(dest_dat):
@@ -397,31 +468,23 @@ class Linpack:
 
         n_size = self.__calculate_n(memory_gb, nb_size)
         n_sizes = self.__scale_n(n_size, nb_size)
-        file.replace_line(
-            orig_dat,
-            r"\d+\s+# of problems sizes \(N\)",
-            str(len(n_sizes)) + "      # of problems sizes (N)",
-        )
-        file.replace_line(
-            orig_dat,
-            r"(\d+\s)+\s*Ns",
-            " ".join(str(size) for size in n_sizes) + "   Ns",
-        )
-        file.replace_line(orig_dat, r"(\d+\s)+\s*NBs", str(nb_size) + "    NBs")
-
         grid = self.__grid(mpi_threads)
-        file.replace_line(
-            orig_dat,
-            r"\d+\s+# of process grids \(P x Q\)",
-            "1  # of process grids (P x Q)",
-        )
-        file.replace_line(orig_dat, r"([0-9]+\s+)+Ps", "{}  Ps".format(grid.P))
-        file.replace_line(orig_dat, r"([0-9]+\s+)+Qs", "{}  Qs".format(grid.Q))
+        file.replace_lines(orig_dat, [
+            (
+                N_COUNT_PATTERN,
+                str(len(n_sizes)) + "      # of problems sizes (N)",
+            ),
+            (NS_PATTERN, " ".join(str(size) for size in n_sizes) + "   Ns"),
+            (NBS_PATTERN, str(nb_size) + "    NBs"),
+            (GRID_COUNT_PATTERN, "1  # of process grids (P x Q)"),
+            (PS_PATTERN, "{}  Ps".format(grid.P)),
+            (QS_PATTERN, "{}  Qs".format(grid.Q)),
+        ])
 
         logging.info("Replacing High-Performance Linpack DAT file.")
         shutil.copyfile(orig_dat, dest_dat)
 
-        if filecmp.cmp(orig_dat, dest_dat):
+        if filecmp.cmp(orig_dat, dest_dat, shallow=False):
             return True
         return False
 
@@ -475,12 +538,26 @@ class Linpack:
         grid = self.__grid(mpi_threads)
         nb_size = self.__nb_size(threads)
 
-        mpi_cmd = "{}/mpirun -n {} --allow-run-as-root --mca mpi_paffinity_alone 1".format(
-            openmpi_dir, mpi_threads)
-
-        if threads == mpi_threads:
-            mpi_cmd = "{}/mpirun -n {} --allow-run-as-root".format(
-                openmpi_dir, mpi_threads)
+        # One rank runs per physical core, so each rank is pinned to exactly
+        # one core and keeps its OpenMP threads on it. `threads` counts SMT
+        # siblings, which `--bind-to core` PE counts do not.
+        threads_per_rank = 1
+        shell_env["OMP_PROC_BIND"] = "close"
+        shell_env["OMP_PLACES"] = "cores"
+        shell_env["OMP_NUM_THREADS"] = str(threads_per_rank)
+        # The BLAS runs single-threaded inside each rank. Letting it spawn its
+        # own threads on top of the MPI ranks oversubscribes the cores and
+        # leaves threads spinning in sched_yield.
+        for blas_threads in ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                             "BLIS_NUM_THREADS"):
+            shell_env[blas_threads] = "1"
+
+        mpi_cmd = ("{}/mpirun -n {} --allow-run-as-root --bind-to core "
+                   "--map-by socket:PE={} "
+                   "--mca coll_tuned_use_dynamic_rules 1 "
+                   "--mca coll_tuned_allreduce_algorithm 3 "
+                   "--mca mpi_preconnect_all 1".format(openmpi_dir, mpi_threads,
+                                                       threads_per_rank))
 
         logging.info('Running LINPACK using "%s" arch.', arch)
 
@@ -491,26 +568,56 @@ class Linpack:
 
         cmd = mpi_cmd + " ./xhpl"
 
-        self.commands.append("Run: " + cmd)
-
-        optimize.prerun()
-        time.sleep(10)
+        self.commands.append("Run: OMP_PROC_BIND = close")
+        self.commands.append("Run: OMP_PLACES = cores")
+        self.commands.append("Run: OMP_NUM_THREADS = " + str(threads_per_rank))
+        self.commands.append("Run: OPENBLAS_NUM_THREADS = 1")
+        self.commands.append("Run: MKL_NUM_THREADS = 1")
+        self.commands.append("Run: BLIS_NUM_THREADS = 1")
+        # Back the HPL matrix with huge pages to cut dTLB misses. Explicit
+        # hugetlbfs pages are used when libhugetlbfs is installed.
+        for hugetlbfs_lib in ("/usr/lib64/libhugetlbfs.so",
+                              "/usr/lib/x86_64-linux-gnu/libhugetlbfs.so",
+                              "/usr/lib/libhugetlbfs.so"):
+            if os.path.isfile(hugetlbfs_lib):
+                shell_env["HUGETLB_MORECORE"] = "yes"
+                shell_env["HUGETLB_VERBOSE"] = "0"
+                shell_env["LD_PRELOAD"] = hugetlbfs_lib
+                self.commands.append("Run: HUGETLB_MORECORE = yes")
+                self.commands.append("Run: LD_PRELOAD = " + hugetlbfs_lib)
+                break
+        if optimize.enable_hugepages():
+            self.commands.append(
+                "Run: echo always > /sys/kernel/mm/transparent_hugepage/enabled"
+            )
 
-        output = execute.output(cmd, working_dir=bin_dir, environment=shell_env)
-
-        file.write(self.results_dir + "/linpack_output.txt", output)
-
-        result = grep.text(
-            output, r"\s+{}\s+{}\s+{}\s+".format(nb_size, grid.P, grid.Q))
+        self.commands.append("Run: " + cmd)
 
-        for line in result:
-            # 7th word
-            tmp = float(line.split()[6])
-            tmp_results.append(tmp)
+        # Scores are parsed while the output is written so it is only held
+        # and scanned once.
+        # e.g., "WR11C2R4  137472  384  8  14  1234.56  1.4049e+03"
+        score_line = re.compile(
+            r"^\S+\s+\d+\s+{}\s+{}\s+{}\s+\S+\s+(?P<gflops>\S+)".format(
+                nb_size, grid.P, grid.Q))
+        # Huge pages are a system setting, so they are turned off again even
+        # if the run fails.
+        try:
+            optimize.prerun()
+            optimize.wait_until_quiesced()
+
+            with open(self.results_dir + "/linpack_output.txt", "w") as output:
+                for line in execute.stream(cmd,
+                                           working_dir=bin_dir,
+                                           environment=shell_env):
+                    output.write(line)
+                    score = score_line.match(line)
+                    if score:
+                        tmp_results.append(float(score.group("gflops")))
+        finally:
+            optimize.disable_hugepages()
 
         if tmp_results:
-            sorted_results = sorted(tmp_results)
-            results["score"] = sorted_results[-1]
+            results["score"] = max(tmp_results)
 
         logging.info("LINPACK results: %s", str(results))
 
@@ -5,6 +5,7 @@ This module handles the downloading, extracting, setting up, building,
 and running LMbench.
 """
 
+import bisect
 import logging
 import os
 
@@ -76,8 +77,8 @@ class LMbench:
 
         logging.info("Extracting LMbench.")
 
-        extract.tar(file_path, self.src_dir)
-        os.rename(self.lmbench_dir + self.version, self.lmbench_dir)
+        extract.tar_stripped(file_path, self.lmbench_dir,
+                             "lmbench{}/".format(self.version))
 
         if os.path.isdir(self.lmbench_dir):
             return True
@@ -113,7 +114,11 @@ class LMbench:
         if os.path.isfile(bin_loc):
             return True
 
-        if not os.path.isdir(self.lmbench_dir):
+        # The SCCS file lives inside the LMbench directory, so the directory
+        # only needs checking when the file is missing.
+        sccs_missing = file.missing([sccs_file]) is not None
+
+        if sccs_missing and not os.path.isdir(self.lmbench_dir):
             text = 'Cannot compile LMbench because "{}" could not be ' "found.".format(
                 self.lmbench_dir)
             prettify.error_message(text)
@@ -129,7 +134,7 @@ class LMbench:
         )
 
         # This file creates errors if it is not present
-        if not os.path.exists(sccs_file):
+        if sccs_missing:
             os.makedirs(sccs_dir, exist_ok=True)
             file.touch(sccs_file)
 
@@ -145,31 +150,47 @@ class LMbench:
         return False
 
     @staticmethod
-    def __closest_cache_latency(cache_size, lmbench_output):
-        """The closest LMbench stride cache latency lower than max cache size.
+    def __parse_latencies(lmbench_output):
+        """Parse the array sizes and latencies from the lmbench results.
 
         Args:
-            cache_size (float): The cache size to compare.
             lmbench_output (str): The contents of the lmbench results.
 
         Returns:
-            Float: The closest latency to max cache size.
+            Tuple: The array sizes in MB and their latencies, in output order.
         """
-        lines = lmbench_output.split("\n")
-        tmp_latency = None
-        for line in lines:
+        sizes = []
+        latencies = []
+        for line in lmbench_output.splitlines():
             if "stride" in line:
                 continue
             words = line.split()
-            if not words:
+            if len(words) < 2:
                 continue
-            current_cache_size = float(words[0])
-            current_cache_latency = float(words[1])
-            if current_cache_size <= cache_size:
-                tmp_latency = current_cache_latency
+            try:
+                size, latency = float(words[0]), float(words[1])
+            except ValueError:
                 continue
-            break
-        return tmp_latency
+            sizes.append(size)
+            latencies.append(latency)
+        return sizes, latencies
+
+    @staticmethod
+    def __closest_cache_latency(cache_size, sizes, latencies):
+        """The closest LMbench stride cache latency lower than max cache size.
+
+        Args:
+            cache_size (float): The cache size to compare.
+            sizes (list): The ascending array sizes from `__parse_latencies`.
+            latencies (list): The latencies from `__parse_latencies`.
+
+        Returns:
+            Float: The closest latency to max cache size.
+        """
+        index = bisect.bisect_right(sizes, cache_size) - 1
+        if index < 0:
+            return None
+        return latencies[index]
 
     def run(self, l1_cache, l2_cache, l3_cache, arch=None, threads=None):
         """Run High-Performance Linpack three times.
@@ -235,16 +256,20 @@ class LMbench:
         output = execute.output(run_command)
         file.write(result_file, output)
 
+        sizes, latencies = self.__parse_latencies(output or "")
+        l2_latency = None
+        l3_latency = None
+
         l1_latency = self.__closest_cache_latency(
-            float(l1_cache) / 1024.0 / 1024.0, output)
+            float(l1_cache) / 1024.0 / 1024.0, sizes, latencies)
 
         if l2_cache:
             l2_latency = self.__closest_cache_latency(
-                float(l2_cache) / 1024.0 / 1024.0, output)
+                float(l2_cache) / 1024.0 / 1024.0, sizes, latencies)
 
         if l3_cache:
             l3_latency = self.__closest_cache_latency(
-                float(l3_cache) / 1024.0 / 1024.0, output)
+                float(l3_cache) / 1024.0 / 1024.0, sizes, latencies)
 
         if l1_latency:
             results["level1"] = float(l1_latency)
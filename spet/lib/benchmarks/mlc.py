@@ -12,7 +12,7 @@ from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
 from spet.lib.utilities import file
-from spet.lib.utilities import grep
+from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
 
 
@@ -105,34 +105,23 @@ class MemoryLatencyChecker:
             Original results with the added |average| and |median| keys and
             values.
         """
-        if "run1" not in results:
+        run_keys = [key for key in results if key.startswith("run")]
+        if not run_keys:
             prettify.error_message(
                 "Cannot calculate the node statistics for MLC because the "
                 "results list is empty.")
             return results
 
-        averages = []
-        medians = []
-        variances = []
-        ranges = []
-
         logging.debug("Computing node statistics.")
 
-        for node in range(0, len(results["run1"])):
-            latencies = []
-            logging.debug("node: %s", repr(node))
-            for run in results:
-                logging.debug("run: %s", repr(run))
-                if "run" not in run:
-                    continue
-                logging.debug("Appending: %s", repr(float(results[run][node])))
-                latencies.append(float(results[run][node]))
-
-            averages.append(statistics.mean(latencies))
-            medians.append(statistics.median(latencies))
-            variances.append(statistics.variance(latencies))
-            sorted_latencies = sorted(latencies)
-            ranges.append(sorted_latencies[-1] - sorted_latencies[0])
+        # One row of latencies per run, transposed to one column per node.
+        runs = [list(map(float, results[key])) for key in run_keys]
+        nodes = list(zip(*runs))
+
+        averages = [statistics.mean(latencies) for latencies in nodes]
+        medians = [statistics.median(latencies) for latencies in nodes]
+        variances = [statistics.variance(latencies) for latencies in nodes]
+        ranges = [max(latencies) - min(latencies) for latencies in nodes]
 
         logging.debug("Averages:\n%s", repr(averages))
         results["average"] = averages
@@ -168,7 +157,7 @@ class MemoryLatencyChecker:
                 error (str): Error message.
         """
         bin_loc = self.mlc_dir + "/Linux/mlc_avx512"
-        cmd = "modprobe msr; {} --latency_matrix".format(bin_loc)
+        cmd = "{} --latency_matrix".format(bin_loc)
         results = {"unit": "ns"}
 
         if not os.path.isfile(bin_loc):
@@ -180,18 +169,29 @@ class MemoryLatencyChecker:
         os.makedirs(self.results_dir, exist_ok=True)
         self.commands.append("Run: " + cmd)
 
-        output = execute.output(cmd, self.mlc_dir)
-
-        file.write(self.results_dir + "/mlc_output.txt", output)
-
-        found_lines = grep.text(output, r"^\s*0")
-
-        if found_lines:
-            node_latencies = found_lines[0].strip().split()
-            node_latencies.pop(0)  # Remove leading '0' for first node
-            for index, latency in enumerate(node_latencies):
-                node_latencies[index] = float(latency)
-            results["latencies"] = node_latencies
+        # The msr device exists once the module is loaded or built in.
+        if not os.path.exists("/dev/cpu/0/msr"):
+            self.commands.append("Run: modprobe msr")
+            execute.output("modprobe msr")
+
+        optimize.prerun_memory_benchmark()
+
+        # The latency matrix row for the first node starts with its ID, "0",
+        # and is picked out while the output streams in.
+        lines = []
+        first_node = None
+        for line in execute.stream(cmd, self.mlc_dir):
+            lines.append(line)
+            if first_node is None and line.lstrip().startswith("0"):
+                first_node = line
+
+        file.write_dontneed(self.results_dir + "/mlc_output.txt",
+                            "".join(lines))
+
+        if first_node:
+            results["latencies"] = [
+                float(latency) for latency in first_node.split()[1:]
+            ]
 
         logging.info("MLC results: %s", str(results))
         return results
@@ -5,12 +5,14 @@ This module handles the downloading, extracting, setting up, building,
 and running OpenSSL.
 """
 
+import functools
 import logging
 import os
 import re
+import shutil
 import statistics
-import time
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
@@ -102,23 +104,33 @@ class OpenSSL:
         Args:
             glibc_ver (str): The glibc version installed in the source
                 directory.
-            cores (int, optional): The number of cores on the system.
+            cores (int, optional): The number of Make jobs. Defaults to
+                every usable CPU.
             cflags (str, optional): The CFLAGS for GCC.
 
         Returns:
             Boolean: True if compilation was successful otherwise False.
         """
         if cores is None:
-            cores = 1
+            cores = cpu.recommended_j()
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if "-O" not in cflags:
             cflags += " -O3 "
+        if {"vaes", "vpclmulqdq"} <= cpu.features():
+            # Icelake and newer use the stitched AVX-512 AES-GCM kernel.
+            cflags += cpu.avx512_cflags() + "-mvaes -mvpclmulqdq "
+        if self.__version_tuple(self.version) < (3, 2):
+            logging.warning(
+                "OpenSSL %s predates the VAES AES-GCM kernel; use 3.2 or "
+                "newer for Icelake and later processors.", self.version)
 
         bin_loc = self.openssl_dir + "/apps/openssl"
         shell_env = os.environ.copy()
 
         shell_env["CFLAGS"] = cflags
+        if shutil.which("ccache"):
+            shell_env["CC"] = "ccache gcc"
 
         if os.path.isfile(bin_loc):
             return True
@@ -143,32 +155,48 @@ class OpenSSL:
                       "-Wl,--dynamic-linker=/usr/local/glibc/lib/ld-{0}.so "
                       "-Wl,-rpath,{1} --prefix={1}/build".format(
                           glibc_ver, self.openssl_dir))
-        make_cmd = "make -s -j {}".format(cores)
-        install_cmd = "make -s -j {} install".format(cores)
+        # `install` depends on the build targets, so one Make pass does both.
+        install_cmd = "make -s -j {0} -l {0} install".format(cores)
 
         self.commands.append("Build: CFLAGS = " + cflags)
         self.commands.append("Config: " + config_cmd)
-        self.commands.append("Compile: " + make_cmd)
         self.commands.append("Install: " + install_cmd)
 
         logging.debug("Config command:\n%s\n", config_cmd)
 
-        execute.output(config_cmd, self.openssl_dir, environment=shell_env)
+        if not os.path.isfile(self.openssl_dir + "/Makefile"):
+            execute.output(config_cmd, self.openssl_dir, environment=shell_env)
 
-        compile_output = execute.output("make -s -j {}".format(cores),
+        install_output = execute.output(install_cmd,
                                         self.openssl_dir,
                                         environment=shell_env)
-
-        logging.debug("Compilation warnings/errors:\n%s", compile_output)
-
-        install_output = execute.output(install_cmd, self.openssl_dir)
-        logging.debug("Installation warnings/errors:\n%s", install_output)
+        logging.debug("Compilation warnings/errors:\n%s", install_output)
 
         if os.path.isfile(bin_loc):
             return True
         return False
 
     @staticmethod
+    def __version_tuple(text):
+        """Numeric OpenSSL version from a version string.
+
+        Example:
+            >>> __version_tuple("OpenSSL 3.2.1 30 Jan 2024")
+            (3, 2, 1)
+
+        Args:
+            text (str): Text containing an OpenSSL version number.
+
+        Return:
+            Tuple: The version numbers, otherwise an empty tuple.
+        """
+        match = re.search(r"(\d+)\.(\d+)\.(\d+)", text)
+        if not match:
+            return ()
+        return tuple(int(number) for number in match.groups())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
     def __taskset_ids(threads):
         """Numerical list of processor ids for `taskset -c`.
 
@@ -195,6 +223,42 @@ class OpenSSL:
             int(threads - 1),
         )
 
+    @staticmethod
+    def __bind_cmd(taskset_ids):
+        """Command prefix pinning the workers and their memory.
+
+        Args:
+            taskset_ids (str): Numerical list of processor ids for
+                `taskset -c`.
+
+        Return:
+            Str: A `numactl` prefix allocating memory on each worker's local
+            node, or a `taskset` prefix when `numactl` is unavailable.
+        """
+        if shutil.which("numactl"):
+            return "numactl --localalloc --physcpubind={}".format(taskset_ids)
+
+        return "taskset -c {}".format(taskset_ids)
+
+    @staticmethod
+    def __speed(command, environment):
+        """Run `openssl speed`, keeping the final result line as it streams.
+
+        Args:
+            command (str): The `openssl speed` command.
+            environment (dict): All environment variables for the shell.
+
+        Return:
+            Tuple: The full output and its last non-empty line (or None).
+        """
+        lines = []
+        last_line = None
+        for line in execute.stream(command, environment=environment):
+            lines.append(line)
+            if not line.isspace():
+                last_line = line
+        return "".join(lines), last_line
+
     @staticmethod
     def __multi_num(threads, taskset_ids):
         """The OpenSSL `-multi` flag based off of `taskset -c` processors.
@@ -250,6 +314,7 @@ class OpenSSL:
         """
         taskset_ids = self.__taskset_ids(threads)
         multi_num = self.__multi_num(threads, taskset_ids)
+        bind_cmd = self.__bind_cmd(taskset_ids)
         bin_loc = self.openssl_dir + "/apps/openssl"
         results = {
             "aes-128-gcm": {
@@ -280,6 +345,21 @@ class OpenSSL:
             prettify.error_message(text)
             return {"error": text}
 
+        version = self.__version_tuple(
+            execute.output(bin_loc + " version", environment=shell_env) or "")
+        if not version:
+            text = 'Could not determine the OpenSSL version of "{}".'.format(
+                bin_loc)
+            prettify.error_message(text)
+            return {"error": text}
+
+        provider = ""
+        if version >= (3, 0):
+            provider = " -provider default"
+        if version < (3, 2):
+            logging.warning("OpenSSL %s does not use the VAES AES-GCM kernel.",
+                            ".".join(str(number) for number in version))
+
         logging.info(
             "Running OpenSSL on ids %s using a total of %d threads.",
             taskset_ids,
@@ -287,13 +367,21 @@ class OpenSSL:
         )
 
         os.makedirs(self.results_dir, exist_ok=True)
+        optimize.prerun_compute_benchmark()
+
+        # Runs are not pipelined: each `speed` run already uses every
+        # processor it is given, and parsing its last line is negligible, so
+        # overlapping that work with the next run would only disturb it.
+        # Raw output is saved once every timed run is over, so no disk I/O
+        # competes with a `speed` run either.
+        raw_outputs = []
 
         for test in results:
             encrypt_results = []
             decrypt_results = []
 
-            cmd_base = "taskset -c {} {} speed -multi {} -evp {}".format(
-                taskset_ids, bin_loc, multi_num, test)
+            cmd_base = "{} {} speed -multi {} -evp {}{}".format(
+                bind_cmd, bin_loc, multi_num, test, provider)
             cmd_decrypt = cmd_base + " -decrypt"
 
             self.commands.append("Run: " + cmd_base)
@@ -306,47 +394,38 @@ class OpenSSL:
                     self.results_dir, test, run_num)
                 decrypt_result_file = "{}/openssl_{}_decrypt_{}.txt".format(
                     self.results_dir, test, run_num)
-                cmd_decrypt = cmd_base + " -decrypt"
 
                 logging.debug("Encrypt command: %s", cmd_base)
                 logging.debug("LD_LIBRARY_PATH: %s",
                               shell_env["LD_LIBRARY_PATH"])
 
-                optimize.prerun()
-                time.sleep(10)
+                optimize.wait_until_quiesced(load_threshold=0.05 * cpu.count())
 
-                encrypt_output = execute.output(cmd_base, environment=shell_env)
-                file.write(encrypt_result_file, encrypt_output)
+                encrypt_output, encrypt_line = self.__speed(cmd_base, shell_env)
+                raw_outputs.append((encrypt_result_file, encrypt_output))
 
-                logging.debug("Decrypt command: %s", cmd_base)
+                logging.debug("Decrypt command: %s", cmd_decrypt)
                 logging.debug("LD_LIBRARY_PATH: %s",
                               shell_env["LD_LIBRARY_PATH"])
 
-                optimize.prerun()
-                time.sleep(10)
+                # Decryption reuses the caches encryption just warmed.
+                decrypt_output, decrypt_line = self.__speed(
+                    cmd_decrypt, shell_env)
+                raw_outputs.append((decrypt_result_file, decrypt_output))
 
-                decrypt_output = execute.output(cmd_decrypt,
-                                                environment=shell_env)
-                file.write(decrypt_result_file, decrypt_output)
+                encrypt_scores = (encrypt_line or "").split()
+                decrypt_scores = (decrypt_line or "").split()
 
-                encrypt_scores = encrypt_output.rstrip().split("\n")
-                decrypt_scores = decrypt_output.rstrip().split("\n")
-
-                if not encrypt_scores:
+                if len(encrypt_scores) < 7:
                     continue
-                if not decrypt_scores:
+                if len(decrypt_scores) < 7:
                     continue
-                encrypt_score = encrypt_scores[-1].split()[6]
-                decrypt_score = decrypt_scores[-1].split()[6]
-
-                if "k" in encrypt_score:
-                    encrypt_score = re.sub(r"[^0-9.]", "", encrypt_score)
-                if "k" in decrypt_score:
-                    decrypt_score = re.sub(r"[^0-9.]", "", decrypt_score)
+                encrypt_score = encrypt_scores[6]
+                decrypt_score = decrypt_scores[6]
 
                 # The 'numbers' are in 1000s of bytes per second processed.
-                encrypt_score = float(encrypt_score) * 1000.0
-                decrypt_score = float(decrypt_score) * 1000.0
+                encrypt_score = float(encrypt_score.rstrip("k")) * 1000.0
+                decrypt_score = float(decrypt_score.rstrip("k")) * 1000.0
 
                 encrypt_results.append(encrypt_score)
                 decrypt_results.append(decrypt_score)
@@ -356,28 +435,21 @@ class OpenSSL:
                 results[test][run_num]["decrypt"] = decrypt_score
 
             if encrypt_results and decrypt_results:
-                results[test]["average"] = {}
-                results[test]["average"]["encrypt"] = statistics.mean(
-                    encrypt_results)
-                results[test]["average"]["decrypt"] = statistics.mean(
-                    decrypt_results)
-                results[test]["median"] = {}
-                results[test]["median"]["encrypt"] = statistics.median(
-                    encrypt_results)
-                results[test]["median"]["decrypt"] = statistics.median(
-                    decrypt_results)
-                results[test]["variance"] = {}
-                results[test]["variance"]["encrypt"] = statistics.variance(
-                    encrypt_results)
-                results[test]["variance"]["decrypt"] = statistics.variance(
-                    decrypt_results)
-                results[test]["range"] = {}
-                sorted_encrypt = sorted(encrypt_results)
-                results[test]["range"]["encrypt"] = (sorted_encrypt[-1] -
-                                                     sorted_encrypt[0])
-                sorted_decrypt = sorted(decrypt_results)
-                results[test]["range"]["decrypt"] = (sorted_decrypt[-1] -
-                                                     sorted_decrypt[0])
+                for key in ("average", "median", "variance", "range"):
+                    results[test][key] = {}
+                for direction, scores in (("encrypt", encrypt_results),
+                                          ("decrypt", decrypt_results)):
+                    results[test]["average"][direction] = statistics.mean(
+                        scores)
+                    results[test]["median"][direction] = statistics.median(
+                        scores)
+                    results[test]["variance"][direction] = statistics.variance(
+                        scores)
+                    results[test]["range"][direction] = (max(scores) -
+                                                         min(scores))
+
+        for result_file, output in raw_outputs:
+            file.write_dontneed(result_file, output)
 
         logging.info("OpenSSL results: %s", str(results))
 
@@ -9,8 +9,8 @@ import logging
 import os
 import stat
 import statistics
-import time
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import file
@@ -18,6 +18,14 @@ from spet.lib.utilities import grep
 from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
 
+# One binary run is split into three runs of ten timed iterations each; STREAM
+# does not count the first iteration.
+NTIMES = 31
+RUNS = 3
+ITERATION_LABEL = "Triad-iteration:"
+# Doubles per 2 MiB huge page.
+HUGE_PAGE_ELEMENTS = (2 * 1024 * 1024) // 8
+
 
 class STREAM:
     """GCC compiled STREAM memory bandwidth benchmarking.
@@ -74,7 +82,8 @@ class STREAM:
             sockets (int): The number of sockets on the system.
 
         Returns:
-            Integer: STREAM array size
+            Integer: STREAM array size, rounded up so each array fills whole
+            2 MiB huge pages.
         """
         multiplier = 4
         min_array_size = 10000000
@@ -84,7 +93,30 @@ class STREAM:
         if stream_array_size < min_array_size:
             stream_array_size = min_array_size
 
-        return int(stream_array_size)
+        stream_array_size = int(stream_array_size) + HUGE_PAGE_ELEMENTS - 1
+        return stream_array_size - stream_array_size % HUGE_PAGE_ELEMENTS
+
+    @staticmethod
+    def __add_iteration_output(stream_file):
+        """Patch STREAM to print the Triad rate of every iteration.
+
+        Args:
+            stream_file (str): The STREAM source file.
+
+        Returns:
+            Boolean: True if the source was patched, False if it already was.
+        """
+        if ITERATION_LABEL in (file.read(stream_file) or ""):
+            return False
+
+        file.replace_line(
+            stream_file,
+            r"/\*\s*--- SUMMARY --- \*/",
+            r'\g<0>\n    for (k=1; k<NTIMES; k++)\n'
+            r'        printf("' + ITERATION_LABEL + r' %12.1f\\n", '
+            r"1.0E-06 * bytes[3] / times[3][k]);",
+        )
+        return True
 
     def build(self, cache, sockets, cflags=None, stream_array_size=None):
         """Compiles STREAM with GCC.
@@ -104,6 +136,10 @@ class STREAM:
             cflags += " -O3 "
 
         cflags += " -fopenmp "
+        cflags += " -funroll-loops -ffast-math -fno-trapping-math "
+        if cpu.info()["avx512"]:
+            # Lets the kernels use 512-bit nontemporal stores.
+            cflags += " -mprefer-vector-width=512 "
 
         stream_file = self.stream_dir + "/stream.c"
         stream_exe = self.stream_dir + "/stream"
@@ -119,6 +155,12 @@ class STREAM:
 
         mpicc = mpi_path + "/mpicc"
 
+        if (os.path.isfile(stream_file) and
+                self.__add_iteration_output(stream_file) and
+                os.path.isfile(stream_exe)):
+            # Rebuild binaries without the per-iteration output.
+            os.remove(stream_exe)
+
         if os.path.isfile(stream_exe):
             return True
 
@@ -135,7 +177,7 @@ class STREAM:
 
         cflags += " -D_OPENMP "
         cflags += " -DSTREAM_ARRAY_SIZE={} ".format(stream_array_size)
-        cflags += " -DNTIMES=1000 "
+        cflags += " -DNTIMES={} ".format(NTIMES)
 
         build_cmd = "{} {} stream.c -o stream".format(mpicc, cflags)
 
@@ -195,7 +237,10 @@ class STREAM:
             shell_env["LD_LIBRARY_PATH"] = mpi_lib
         results = {"unit": "MB/s"}
 
-        shell_env["OMP_PROC_BIND"] = "true"
+        # Spread threads over every node; STREAM initializes its arrays in
+        # parallel, so first touch then places each chunk on its local node.
+        shell_env["OMP_PLACES"] = "cores"
+        shell_env["OMP_PROC_BIND"] = "spread"
 
         if not os.path.isfile(stream_bin):
             text = 'Cannot run STREAM because "{}" could not be found.'.format(
@@ -207,38 +252,56 @@ class STREAM:
 
         os.makedirs(self.results_dir, exist_ok=True)
 
-        tmp_results = []
-
         cmd = "./stream"
+        result_file = self.results_dir + "/stream.txt"
 
         self.commands.append("Run: OMP_NUM_THREADS = " + str(threads))
-        self.commands.append("Run: OMP_PROC_BIND = true")
+        self.commands.append("Run: OMP_PLACES = cores")
+        self.commands.append("Run: OMP_PROC_BIND = spread")
         self.commands.append("Run: " + cmd)
 
-        for count in range(1, 4):
-            run_num = "run" + str(count)
-            result_file = "{}/stream_{}.txt".format(self.results_dir, run_num)
+        # The arrays are static, so transparent huge pages back them.
+        if optimize.enable_hugepages():
+            self.commands.append(
+                "Run: echo always > /sys/kernel/mm/transparent_hugepage/enabled"
+            )
 
-            optimize.prerun()
-            time.sleep(10)
+        # Huge pages are a system setting, so they are turned off again even
+        # if the run fails.
+        try:
+            optimize.prerun_memory_benchmark()
+            optimize.wait_until_quiesced(load_threshold=0.05 * cpu.count())
 
             output = execute.output(cmd,
                                     working_dir=self.stream_dir,
                                     environment=shell_env)
+        finally:
+            optimize.disable_hugepages()
 
-            file.write(result_file, output)
+        file.write_dontneed(result_file, output)
 
-            result = grep.text(output, "Triad")
-            result = result[0].split()[1]  # 2nd word
-            result = float(result)
-            results[run_num] = result
+        rates = [
+            float(line.split()[1])
+            for line in grep.text(output, ITERATION_LABEL)
+        ]
+        if len(rates) < RUNS:
+            text = "STREAM did not report per-iteration Triad rates."
+            prettify.error_message(text)
+            return {"error": text}
+
+        # Best Triad rate of each consecutive slice of iterations, the same
+        # "best rate" STREAM itself reports.
+        per_run = len(rates) // RUNS
+        tmp_results = []
+        for count in range(1, RUNS + 1):
+            result = max(rates[(count - 1) * per_run:count * per_run])
+            results["run" + str(count)] = result
             tmp_results.append(result)
 
         results["average"] = statistics.mean(tmp_results)
         results["median"] = statistics.median(tmp_results)
         results["variance"] = statistics.variance(tmp_results)
-        sorted_results = sorted(tmp_results)
-        results["range"] = sorted_results[-1] - sorted_results[0]
+        results["range"] = max(tmp_results) - min(tmp_results)
 
         logging.info("STREAM results: %s", str(results))
 
@@ -5,23 +5,308 @@ This module handles the downloading, extracting, setting up, and running
 MySQL and Cassandra.
 """
 
+import concurrent.futures
+import functools
 import logging
 import os
+import re
 import shutil
-import statistics
 import subprocess
-import time
 
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
 from spet.lib.utilities import file
-from spet.lib.utilities import grep
 from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
+from spet.lib.utilities import stats
 
 # pylint disable=E1135
 
+# e.g., "[OVERALL], Throughput(ops/sec), 41384.11"
+METRIC_PATTERN = re.compile(
+    r"\[(?P<section>OVERALL|READ|UPDATE)\], "
+    r"(?P<metric>Throughput\(ops/sec\)|95thPercentileLatency\(us\)), "
+    r"(?P<value>\S+)")
+METRIC_KEYS = {
+    ("OVERALL", "Throughput(ops/sec)"): "throughput",
+    ("READ", "95thPercentileLatency(us)"): "read_latency",
+    ("UPDATE", "95thPercentileLatency(us)"): "update_latency",
+}
+# e.g., "[INSERT], Return=OK, 2500000". With JDBC batching most inserts
+# are queued and report BATCHED_OK; only the flushing insert reports OK.
+INSERTED_PATTERN = re.compile(r"^\[INSERT\], Return=(?:OK|BATCHED_OK), (\d+)",
+                              re.M)
+# Client processes used to load records.
+LOADERS = 4
+# Client threads per hardware thread during runs, enough to saturate the
+# database. Beyond the server's own request threads more clients only
+# queue in the client: MySQL's default max_connections is 151 and
+# Cassandra's native_transport_max_threads is 128.
+CLIENTS_PER_THREAD = 20
+MYSQL_MAX_CLIENTS = 150
+CASSANDRA_MAX_CLIENTS = 128
+# Throughput is scored by an unthrottled probe. Latencies are measured by
+# a run throttled to this fraction of it, below saturation.
+PROBE_SECONDS = 30
+TARGET_FRACTION = 0.9
+
+
+def parse_metric(line):
+    """A throughput or 95th percentile latency from a YCSB summary line.
+
+    Example:
+        >>> parse_metric("[OVERALL], Throughput(ops/sec), 41384.11")
+        ('throughput', 41384.11)
+
+    Args:
+        line (str): A line of `ycsb run` output.
+
+    Returns:
+        Tuple: The metric name and its value, otherwise None.
+    """
+    match = METRIC_PATTERN.match(line)
+    if not match:
+        return None
+    key = METRIC_KEYS.get((match.group("section"), match.group("metric")))
+    if not key:
+        return None
+    return key, float(match.group("value"))
+
+
+def load_partitioned(command,
+                     records,
+                     threads,
+                     working_dir=None,
+                     environment=None):
+    """Load YCSB records from several client processes at once.
+
+    Each client inserts its own slice of the key space, so a single client
+    JVM does not limit how fast the database is populated.
+
+    Args:
+        command (str): The `ycsb load` command, without `-threads` or record
+            counts.
+        records (int): The total number of records to insert.
+        threads (int): The number of threads on the system.
+        working_dir (str, optional): The YCSB directory.
+        environment (dict, optional): All environment variables for the shell.
+
+    Returns:
+        Tuple: (commands, outputs) of every client process.
+    """
+    loaders = max(1, min(LOADERS, threads))
+    per_loader = (records + loaders - 1) // loaders
+    commands = []
+    for start in range(0, records, per_loader):
+        commands.append("{} -threads {} -p recordcount={} -p insertstart={} "
+                        "-p insertcount={}".format(
+                            command, max(1, threads // loaders), records, start,
+                            min(per_loader, records - start)))
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(commands)) as executor:
+        outputs = list(
+            executor.map(
+                functools.partial(execute.output,
+                                  working_dir=working_dir,
+                                  environment=environment), commands))
+    return commands, outputs
+
+
+def load_complete(outputs, records):
+    """Whether the load clients inserted every record.
+
+    Args:
+        outputs (list): The output of every `ycsb load` client.
+        records (int): The total number of records to insert.
+
+    Returns:
+        Boolean: True if all records were inserted otherwise False.
+    """
+    inserted = 0
+    for output in outputs:
+        for count in INSERTED_PATTERN.findall(output or ""):
+            inserted += int(count)
+    return inserted >= records
+
+
+def run_workload(command, result_file, working_dir=None, environment=None):
+    """Run YCSB, saving its output as it streams.
+
+    Metrics are picked out of each line as it arrives, so large operation
+    counts do not buffer the whole output. The saved output is dropped from
+    the page cache afterwards since it is not read back during the run.
+
+    Args:
+        command (str): The `ycsb run` command.
+        result_file (str): The file to save the output to.
+        working_dir (str, optional): The YCSB directory.
+        environment (dict, optional): All environment variables for the shell.
+
+    Returns:
+        Tuple: (metrics, failed).
+
+            metrics (dict): The metrics found by `parse_metric`.
+            failed (bool): Whether any reads or updates failed.
+    """
+    metrics = {}
+    failed = False
+    with open(result_file, "w") as output:
+        for line in execute.stream(command, working_dir, environment):
+            output.write(line)
+            if "UPDATE-FAILED" in line or "READ-FAILED" in line:
+                failed = True
+            metric = parse_metric(line)
+            if metric:
+                metrics[metric[0]] = metric[1]
+    file.dontneed(result_file)
+    return metrics, failed
+
+
+def probe_throughput(command, result_file, working_dir=None, environment=None):
+    """Unthrottled throughput from a short YCSB run.
+
+    Args:
+        command (str): The probe command, from `probe_command`.
+        result_file (str): The file to save the probe output to.
+        working_dir (str, optional): The YCSB directory.
+        environment (dict, optional): All environment variables for the shell.
+
+    Returns:
+        Float: The operations per second reached, otherwise None if the
+        probe failed.
+    """
+    metrics, failed = run_workload(command, result_file, working_dir,
+                                   environment)
+    if failed or not metrics.get("throughput"):
+        logging.debug("YCSB probe failed; running without a target.")
+        return None
+    return metrics["throughput"]
+
+
+def probe_command(command):
+    """The `ycsb run` command limited to a probe's duration.
+
+    Args:
+        command (str): The `ycsb run` command.
+
+    Returns:
+        String: The command with `maxexecutiontime` set.
+    """
+    return "{} -p maxexecutiontime={}".format(command, PROBE_SECONDS)
+
+
+def run_iterations(run_cmd,
+                   ycsb_dir,
+                   results_dir,
+                   label,
+                   environment=None,
+                   runs=3):
+    """Run a YCSB workload several times.
+
+    Each run is an unthrottled probe, whose throughput is the run's score,
+    followed by a run with `-target` set to a fraction of that throughput,
+    whose latencies are reported. Without a target, YCSB clients only send
+    a request once the previous one finished, which hides queueing from the
+    latencies; with one, the throughput is only the target that was set.
+
+    Args:
+        run_cmd (str): The `ycsb run` command, without `-target`.
+        ycsb_dir (str): The YCSB directory.
+        results_dir (str): The directory to save each run's output to.
+        label (str): The result file prefix, e.g., "ycsb-sql".
+        environment (dict, optional): All environment variables for the shell.
+        runs (int, optional): The number of runs.
+
+    Returns:
+        Tuple: (commands, results).
+
+            commands (list): The probe and latency run commands.
+            results (dict): Each complete run's metrics with their (average,
+                median, variance, range), otherwise (error).
+    """
+    # Caches are only dropped once; later runs keep the database warm.
+    optimize.prerun()
+    optimize.wait_until_quiesced()
+
+    probe_cmd = probe_command(run_cmd)
+    commands = [
+        probe_cmd, "{} -target <{:.0%} of the probe throughput>".format(
+            run_cmd, TARGET_FRACTION)
+    ]
+
+    results = {}
+    run_metrics = []
+    for count in range(1, runs + 1):
+        run_num = "run" + str(count)
+        result_file = "{}/{}_{}.txt".format(results_dir, label, run_num)
+
+        throughput = probe_throughput(
+            probe_cmd, "{}/{}_{}_probe.txt".format(results_dir, label, run_num),
+            ycsb_dir, environment)
+        latency_cmd = run_cmd
+        if throughput:
+            latency_cmd += " -target {}".format(
+                int(throughput * TARGET_FRACTION))
+
+        metrics, failed = run_workload(latency_cmd, result_file, ycsb_dir,
+                                       environment)
+        if failed:
+            return commands, {
+                "error": "YCSB failed to update and/or read database."
+            }
+
+        # An unthrottled latency run measured its own throughput.
+        if throughput:
+            metrics["throughput"] = throughput
+
+        run_metrics.append(metrics)
+        if len(metrics) == len(METRIC_KEYS):
+            results[run_num] = metrics
+
+    if "run1" in results:
+        results.update(summarize_runs(run_metrics))
+    return commands, results
+
+
+def summarize_runs(runs):
+    """Statistics of every metric across YCSB runs.
+
+    Args:
+        runs (list): The metrics of each run, from `run_workload`.
+
+    Returns:
+        Dict: (average, median, variance, range), each mapping the metric
+        names to that statistic.
+    """
+    summary = {"average": {}, "median": {}, "variance": {}, "range": {}}
+    for metric in METRIC_KEYS.values():
+        values = [run[metric] for run in runs if metric in run]
+        if values:
+            for key, value in stats.summarize(values).items():
+                summary[key][metric] = value
+    return summary
+
+
+def maven_environment(src_dir):
+    """Shell environment for running YCSB with Maven.
+
+    Args:
+        src_dir (str): The source directory for installing packages.
+
+    Returns:
+        Dict: A copy of the environment with `M2_HOME` and `M2` set,
+        otherwise None if Maven could not be found.
+    """
+    maven_dir = src_dir + "/maven"
+    if not os.path.isdir(maven_dir):
+        return None
+    shell_env = os.environ.copy()
+    shell_env["M2_HOME"] = maven_dir
+    shell_env["M2"] = maven_dir + "/bin"
+    return shell_env
+
 
 class NoSQL:
     """YCSB NoSQL benchmarking.
@@ -35,15 +320,27 @@ class NoSQL:
         version (str): Version number for YCSB.
         src_dir (str): The source directory for installing packages.
         ycsb_dir (str): The source directory for the YCSB.
+        archive_path (str): The downloaded YCSB archive.
+        cassandra_dir (str): The source directory for Cassandra.
+        records (int): The number of records to load.
+        loaded_marker (str): The file written once every record is loaded.
         results_dir (str): The results directory for the YCSB results.
+        shell_env (dict): The shell environment with Maven, built on first
+            use.
     """
 
     def __init__(self, version, root_dir, results_dir):
         self.version = version
         self.src_dir = root_dir + "/src"
         self.ycsb_dir = self.src_dir + "/ycsb"
+        self.archive_path = "{}/ycsb-{}.tar.gz".format(self.src_dir, version)
+        self.cassandra_dir = self.src_dir + "/cassandra"
+        self.records = 10000000
+        self.loaded_marker = "{}/.ycsb_loaded_{}".format(
+            self.cassandra_dir, self.records)
         self.results_dir = results_dir + "/ycsb_nosql"
         self.commands = []
+        self.shell_env = None
 
     def download(self):
         """Download YCSB.
@@ -53,18 +350,17 @@ class NoSQL:
         """
         url = ("https://github.com/brianfrankcooper/YCSB/releases/download/"
                "{0}/ycsb-{0}.tar.gz".format(self.version))
-        archive_path = "{}/ycsb-{}.tar.gz".format(self.src_dir, self.version)
 
-        if os.path.isfile(archive_path):
-            logging.debug('"%s" exists, exiting early.', archive_path)
+        if os.path.isfile(self.archive_path):
+            logging.debug('"%s" exists, exiting early.', self.archive_path)
             return True
 
         logging.info("Downloading YCSB.")
-        download.file(url, archive_path)
+        download.file(url, self.archive_path)
         logging.debug("Downloading YCSB complete.")
 
-        if os.path.isfile(archive_path):
-            logging.debug('"%s" exists.', archive_path)
+        if os.path.isfile(self.archive_path):
+            logging.debug('"%s" exists.', self.archive_path)
             return True
         return False
 
@@ -74,20 +370,18 @@ class NoSQL:
         Returns:
             Boolean: True if extraction was successful otherwise False.
         """
-        file_path = "{}/ycsb-{}.tar.gz".format(self.src_dir, self.version)
-
         if os.path.isdir(self.ycsb_dir):
             return True
 
-        if not os.path.isfile(file_path):
+        if not os.path.isfile(self.archive_path):
             prettify.error_message(
                 'Cannot extract YCSB because "{}" could not be found.'.format(
-                    file_path))
+                    self.archive_path))
             return False
 
         logging.info("Extracting YCSB")
 
-        extract.tar(file_path, self.src_dir)
+        extract.tar(self.archive_path, self.src_dir)
         os.rename("{}/ycsb-{}".format(self.src_dir, self.version),
                   self.ycsb_dir)
 
@@ -101,44 +395,38 @@ class NoSQL:
         Args:
             threads (int): The number of threads on the system.
         """
-        pid = None
-        shell_env = os.environ.copy()
-        maven_dir = self.src_dir + "/maven"
-
-        if os.path.isdir(maven_dir):
-            shell_env["M2_HOME"] = maven_dir
-            shell_env["M2"] = maven_dir + "/bin"
-        else:
-            return False
+        if self.shell_env is None:
+            self.shell_env = maven_environment(self.src_dir)
+        shell_env = self.shell_env
 
-        cassandra_dir = self.src_dir + "/cassandra"
+        if shell_env is None:
+            return False
 
-        if not os.path.isdir(cassandra_dir):
+        if not os.path.isdir(self.cassandra_dir):
             prettify.error_message(
                 'Cannot start Cassandra because "{}" could not be found.'.
-                format(cassandra_dir))
+                format(self.cassandra_dir))
             return False
 
-        if os.path.exists(self.src_dir + "/cassandra/data/data/ycsb"):
+        if os.path.isfile(self.loaded_marker):
             logging.debug('Skipping Cassandra setup because the "ycsb" table '
-                          "already exists.")
+                          "is already loaded.")
             return True
 
         # Start Cassandra service
-        subprocess.Popen(
-            "./bin/cassandra -R -p /tmp/cassandra.pid &",
-            shell=True,
-            cwd=cassandra_dir,
+        # In the foreground the script execs Java, so this is the server.
+        cassandra = subprocess.Popen(
+            ["./bin/cassandra", "-f", "-R", "-p", "/tmp/cassandra.pid"],
+            cwd=self.cassandra_dir,
             env=shell_env,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
-        time.sleep(20)
+        pid = str(cassandra.pid)
 
-        if os.path.isfile("/tmp/cassandra.pid"):
-            pid = file.read("/tmp/cassandra.pid").strip()
-
-        if not pid or not os.path.dirname("/proc/" + pid):
+        if not execute.wait_for_port(9042) or cassandra.poll() is not None:
+            execute.terminate(pid)
             text = "Cassandra failed to start."
             prettify.error_message(text)
             return False
@@ -146,27 +434,28 @@ class NoSQL:
         # Setup table schema
         execute.output(
             "./bin/cqlsh -f {}/provided/create-table.cql".format(self.src_dir),
-            working_dir=cassandra_dir,
+            working_dir=self.cassandra_dir,
             environment=shell_env,
         )
 
         load_cmd = ("./bin/ycsb load cassandra-cql -s -P workloads/workloada "
-                    '-p hosts="localhost" -threads {} -p recordcount=10000000'.
-                    format(threads))
-
-        self.commands.append("Load: " + load_cmd)
+                    '-p hosts="localhost"')
 
         # Load YCSB records
-        execute.output(load_cmd,
-                       working_dir=self.ycsb_dir,
-                       environment=shell_env)
+        load_cmds, load_ycsb = load_partitioned(load_cmd, self.records, threads,
+                                                self.ycsb_dir, shell_env)
+        self.commands.extend("Load: " + cmd for cmd in load_cmds)
 
         # Stop Cassandra service
-        if pid:
-            execute.kill(pid)
-            execute.kill(pid)
-            execute.kill(pid)
+        execute.terminate(pid, timeout=30)
 
+        if not load_complete(load_ycsb, self.records):
+            logging.debug("\n".join(o or "" for o in load_ycsb))
+            prettify.error_message("Loading the YCSB records into Cassandra "
+                                   "failed.")
+            return False
+
+        file.write(self.loaded_marker, str(self.records))
         return True
 
     def run(self, threads):
@@ -175,144 +464,57 @@ class NoSQL:
         Args:
             threads (int): The number of threads on the system.
         """
-        pid = None
-        shell_env = os.environ.copy()
-        maven_dir = self.src_dir + "/maven"
-        error = False
+        if self.shell_env is None:
+            self.shell_env = maven_environment(self.src_dir)
+        shell_env = self.shell_env
         results = {"unit": {"throughput": "ops/sec", "latency": "us"}}
 
-        if os.path.isdir(maven_dir):
-            shell_env["M2_HOME"] = maven_dir
-            shell_env["M2"] = maven_dir + "/bin"
-        else:
+        if shell_env is None:
             prettify.error_message("Maven could not be found.")
             return False
 
-        cassandra_dir = self.src_dir + "/cassandra"
-
-        if not os.path.exists(cassandra_dir + "/data/data/ycsb"):
-            text = 'Unable to find "ycsb" table in Cassandra.'
+        if not os.path.isfile(self.loaded_marker):
+            text = 'Unable to find loaded "ycsb" table in Cassandra.'
             prettify.error_message(text)
             return {"error": text}
 
-        read_latency_results = []
-        update_latency_results = []
-        throughput_results = []
-
         os.makedirs(self.results_dir, exist_ok=True)
 
         # Start Cassandra service
-        subprocess.Popen(
-            "./bin/cassandra -R -p /tmp/cassandra.pid &",
-            shell=True,
-            cwd=cassandra_dir,
+        # In the foreground the script execs Java, so this is the server.
+        cassandra = subprocess.Popen(
+            ["./bin/cassandra", "-f", "-R", "-p", "/tmp/cassandra.pid"],
+            cwd=self.cassandra_dir,
             env=shell_env,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
-        time.sleep(20)
-
-        if os.path.isfile("/tmp/cassandra.pid"):
-            pid = file.read("/tmp/cassandra.pid").strip()
+        pid = str(cassandra.pid)
 
-        if not pid or not os.path.dirname("/proc/" + pid):
+        if not execute.wait_for_port(9042) or cassandra.poll() is not None:
+            execute.terminate(pid)
             text = "Cassandra failed to start."
             prettify.error_message(text)
             return {"error": text}
 
         run_cmd = ("./bin/ycsb run cassandra-cql -s -P workloads/workloada "
                    '-p hosts="localhost" -threads {} '
-                   "-p operationcount=10000000".format(threads))
-
-        self.commands.append("Run: " + run_cmd)
-
-        for count in range(1, 4):
-            run_num = "run" + str(count)
-            result_file = "{}/ycsb-nosql_{}.txt".format(self.results_dir,
-                                                        run_num)
-
-            optimize.prerun()
-            time.sleep(10)
-
-            output = execute.output(run_cmd,
-                                    working_dir=self.ycsb_dir,
-                                    environment=shell_env)
+                   "-p operationcount=10000000".format(
+                       min(threads * CLIENTS_PER_THREAD,
+                           CASSANDRA_MAX_CLIENTS)))
 
-            file.write(result_file, output)
-
-            if "UPDATE-FAILED" in output or "READ-FAILED" in output:
-                error = True
-                break
-
-            throughput_line = grep.text(output,
-                                        r"\[OVERALL\], Throughput\(ops/sec\),")
-            if throughput_line:
-                throughput = float(throughput_line[-1].split(",")[2].strip())
-                throughput_results.append(throughput)
-
-            readlat_line = grep.text(output,
-                                     r"\[READ\], 95thPercentileLatency\(us\),")
-            if readlat_line:
-                readlat = float(readlat_line[-1].split(",")[2].strip())
-                read_latency_results.append(readlat)
-
-            updatelat_line = grep.text(
-                output, r"\[UPDATE\], 95thPercentileLatency\(us\),")
-            if updatelat_line:
-                updatelat = float(updatelat_line[-1].split(",")[2].strip())
-                update_latency_results.append(updatelat)
-
-            if throughput_line and readlat_line and updatelat_line:
-                results[run_num] = {
-                    "throughput": throughput,
-                    "read_latency": readlat,
-                    "update_latency": updatelat,
-                }
+        run_cmds, run_results = run_iterations(run_cmd, self.ycsb_dir,
+                                               self.results_dir, "ycsb-nosql",
+                                               shell_env)
+        self.commands.extend("Run: " + cmd for cmd in run_cmds)
 
         # Stop Cassandra service
-        if pid:
-            execute.kill(pid)
-            execute.kill(pid)
-            execute.kill(pid)
-
-        if error:
-            return {"error": "YCSB failed to update and/or read database."}
-
-        if "run1" in results:
-            results["average"] = {}
-            results["median"] = {}
-            results["variance"] = {}
-            results["range"] = {}
-
-            results["average"]["throughput"] = statistics.mean(
-                throughput_results)
-            results["median"]["throughput"] = statistics.median(
-                throughput_results)
-            results["variance"]["throughput"] = statistics.variance(
-                throughput_results)
-            sorted_throughput = sorted(throughput_results)
-            results["range"]["throughput"] = (sorted_throughput[-1] -
-                                              sorted_throughput[0])
-
-            results["average"]["read_latency"] = statistics.mean(
-                read_latency_results)
-            results["median"]["read_latency"] = statistics.median(
-                read_latency_results)
-            results["variance"]["read_latency"] = statistics.variance(
-                read_latency_results)
-            sorted_read_latency = sorted(read_latency_results)
-            results["range"]["read_latency"] = (sorted_read_latency[-1] -
-                                                sorted_read_latency[0])
-
-            results["average"]["update_latency"] = statistics.mean(
-                update_latency_results)
-            results["median"]["update_latency"] = statistics.median(
-                update_latency_results)
-            results["variance"]["update_latency"] = statistics.variance(
-                update_latency_results)
-            sorted_update_latency = sorted(update_latency_results)
-            results["range"]["update_latency"] = (sorted_update_latency[-1] -
-                                                  sorted_update_latency[0])
+        execute.terminate(pid, timeout=30)
+
+        if "error" in run_results:
+            return run_results
+        results.update(run_results)
 
         logging.info("YCSB Cassandra results: %s", str(results))
 
@@ -336,7 +538,15 @@ class SQL:
         jconnect_ver (str): Version number for jconnect.
         src_dir (str): The source directory for installing packages.
         ycsb_dir (str): The source directory for the YCSB.
+        archive_path (str): The downloaded YCSB archive.
+        jconnect_archive_path (str): The downloaded J Connector archive.
+        mysql_dir (str): The source directory for MySQL.
+        mysql_data (str): The data directory for MySQL.
+        records (int): The number of records to load.
+        loaded_marker (str): The file written once every record is loaded.
         results_dir (str): The results directory for the YCSB results.
+        shell_env (dict): The shell environment with Maven, built on first
+            use.
     """
 
     def __init__(self, version, jconnect_ver, root_dir, results_dir):
@@ -344,8 +554,17 @@ class SQL:
         self.jconnect_ver = jconnect_ver
         self.src_dir = root_dir + "/src"
         self.ycsb_dir = self.src_dir + "/ycsb"
+        self.archive_path = "{}/ycsb-{}.tar.gz".format(self.src_dir, version)
+        self.jconnect_archive_path = "{}/mysql-connector-java-{}.tar.gz".format(
+            self.src_dir, jconnect_ver)
+        self.mysql_dir = self.src_dir + "/mysql"
+        self.mysql_data = self.mysql_dir + "/mysql-files"
+        self.records = 1000000
+        self.loaded_marker = "{}/.ycsb_loaded_{}".format(
+            self.mysql_dir, self.records)
         self.results_dir = results_dir + "/ycsb_sql"
         self.commands = []
+        self.shell_env = None
 
     def download(self):
         """Download YCSB.
@@ -355,27 +574,31 @@ class SQL:
         """
         ycsb_url = ("https://github.com/brianfrankcooper/YCSB/releases/"
                     "download/{0}/ycsb-{0}.tar.gz".format(self.version))
-        ycsb_archive_path = "{}/ycsb-{}.tar.gz".format(self.src_dir,
-                                                       self.version)
 
         jconnect_url = ("https://dev.mysql.com/get/Downloads/Connector-J/"
                         "mysql-connector-java-{}.tar.gz".format(
                             self.jconnect_ver))
-        jconnect_path = "{}/mysql-connector-java-{}.tar.gz".format(
-            self.src_dir, self.jconnect_ver)
-        if not os.path.isfile(ycsb_archive_path):
+        downloads = []
+        if not os.path.isfile(self.archive_path):
             logging.info("Downloading YCSB.")
-            download.file(ycsb_url, ycsb_archive_path)
-            logging.debug("Downloading YCSB complete.")
+            downloads.append((ycsb_url, self.archive_path))
 
-        if not os.path.isfile(jconnect_path):
+        if not os.path.isfile(self.jconnect_archive_path):
             logging.info("Downloading J Connector.")
-            download.file(jconnect_url, jconnect_path)
-            logging.debug("Downloading J Connector complete.")
-
-        if os.path.isfile(ycsb_archive_path) and os.path.isfile(jconnect_path):
-            logging.debug('"%s" and "%s" exists.', ycsb_archive_path,
-                          jconnect_path)
+            downloads.append((jconnect_url, self.jconnect_archive_path))
+
+        # The archives are independent, so fetch them at the same time.
+        if downloads:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(downloads)) as executor:
+                for url, path in downloads:
+                    executor.submit(download.file, url, path)
+            logging.debug("Downloading YCSB and J Connector complete.")
+
+        if os.path.isfile(self.archive_path) and os.path.isfile(
+                self.jconnect_archive_path):
+            logging.debug('"%s" and "%s" exists.', self.archive_path,
+                          self.jconnect_archive_path)
             return True
         return False
 
@@ -385,35 +608,32 @@ class SQL:
         Returns:
             Boolean: True if extraction was successful otherwise False.
         """
-        ycsb_archive_path = "{}/ycsb-{}.tar.gz".format(self.src_dir,
-                                                       self.version)
         jconnect_dir = "{}/mysql-connector-java-{}".format(
             self.src_dir, self.jconnect_ver)
-        jconnect_archive_path = jconnect_dir + ".tar.gz"
         jconn_final = self.src_dir + "/mysql-connector-java"
 
-        if not os.path.isfile(ycsb_archive_path):
+        if not os.path.isfile(self.archive_path):
             prettify.error_message(
                 'Cannot extract YCSB because "{}" could not be found.'.format(
-                    ycsb_archive_path))
+                    self.archive_path))
             return False
 
-        if not os.path.isfile(jconnect_archive_path):
+        if not os.path.isfile(self.jconnect_archive_path):
             prettify.error_message(
                 'Cannot extract MySQL J Connector because "{}" could not be'
-                " found.".format(jconnect_archive_path))
+                " found.".format(self.jconnect_archive_path))
             return False
 
         if not os.path.isdir(self.ycsb_dir):
             logging.info("Extracting YCSB.")
-            extract.tar(ycsb_archive_path, self.src_dir)
+            extract.tar(self.archive_path, self.src_dir)
             os.rename("{}/ycsb-{}".format(self.src_dir, self.version),
                       self.ycsb_dir)
             logging.info("Extracting YCSB Complete.")
 
         if not os.path.isdir(jconn_final):
             logging.info("Extracting MySQL J Connector.")
-            extract.tar(jconnect_archive_path, self.src_dir)
+            extract.tar(self.jconnect_archive_path, self.src_dir)
             os.rename(jconnect_dir, jconn_final)
             logging.info("Extracting MySQL J Connector Complete.")
 
@@ -421,25 +641,33 @@ class SQL:
             return True
         return False
 
+    @staticmethod
+    def __stop_mysql(mysqld_safe):
+        """Stop a MySQL server that failed to start.
+
+        `mysqld_safe` is stopped first so it does not restart `mysqld`.
+
+        Args:
+            mysqld_safe (subprocess.Popen): The `mysqld_safe` process.
+        """
+        execute.terminate(str(mysqld_safe.pid), timeout=30)
+        if os.path.exists("/tmp/mysql.pid"):
+            execute.terminate(file.read("/tmp/mysql.pid").strip(), timeout=30)
+
     def setup(self, threads):
         """Setup YCSB J Connector, MySQL's "ycsb" table, and load basic records.
 
         Args:
             threads (int): The number of threads on the system.
         """
-        shell_env = os.environ.copy()
-        maven_dir = self.src_dir + "/maven"
+        if self.shell_env is None:
+            self.shell_env = maven_environment(self.src_dir)
+        shell_env = self.shell_env
 
-        if os.path.isdir(maven_dir):
-            shell_env["M2_HOME"] = maven_dir
-            shell_env["M2"] = maven_dir + "/bin"
-        else:
+        if shell_env is None:
             prettify.error_message("Maven could not be found.")
             return False
 
-        mysql_dir = self.src_dir + "/mysql"
-        mysql_data = mysql_dir + "/mysql-files"
-
         jconnect_jar = "mysql-connector-java-{}-bin.jar".format(
             self.jconnect_ver)
         jconnect_path = "{}/mysql-connector-java/{}".format(
@@ -447,73 +675,85 @@ class SQL:
         jdbc_binding_path = "{}/jdbc-binding/lib/{}".format(
             self.ycsb_dir, jconnect_jar)
 
-        if not os.path.isdir(mysql_dir):
+        if not os.path.isdir(self.mysql_dir):
             prettify.error_message(
                 'Cannot start MySQL because "{}" could not be found.'.format(
-                    mysql_dir))
+                    self.mysql_dir))
             return False
 
-        if os.path.exists(mysql_data + "/ycsb"):
+        if os.path.isfile(self.loaded_marker):
             logging.debug('Skipping MySQL setup because the "ycsb" table '
-                          "already exists.")
+                          "is already loaded.")
             return True
 
         # Start MySQL service
-        subprocess.Popen(
-            "{0}/bin/mysqld_safe --user=root --basedir={0} --datadir={1} "
-            "--plugin-dir={0}/lib/plugin --pid-file=/tmp/mysql.pid "
-            "--log-error=ycsb.err &".format(mysql_dir, mysql_data),
-            cwd=mysql_dir,
-            shell=True,
+        mysqld_safe = subprocess.Popen(
+            [
+                self.mysql_dir + "/bin/mysqld_safe",
+                "--user=root",
+                "--basedir=" + self.mysql_dir,
+                "--datadir=" + self.mysql_data,
+                "--plugin-dir={}/lib/plugin".format(self.mysql_dir),
+                "--pid-file=/tmp/mysql.pid",
+                "--log-error=ycsb.err",
+            ],
+            cwd=self.mysql_dir,
             env=shell_env,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
-        time.sleep(20)
+
+        if not execute.wait_for_port(3306) or not execute.alive(
+                file.read("/tmp/mysql.pid")):
+            self.__stop_mysql(mysqld_safe)
+            prettify.error_message("MySQL failed to start.")
+            return False
 
         # Setup ycsb database
         schema_output = execute.output(
             "./bin/mysql -uroot --skip-password < "
             "{}/provided/create-table.mysql".format(self.src_dir),
-            working_dir=mysql_dir,
+            working_dir=self.mysql_dir,
             environment=shell_env,
         )
 
         logging.debug(schema_output)
-        if os.path.isfile(mysql_data + "/ycsb.err"):
-            logging.debug(file.read(mysql_data + "/ycsb.err"))
+        if os.path.isfile(self.mysql_data + "/ycsb.err"):
+            logging.debug(file.read(self.mysql_data + "/ycsb.err"))
 
         shutil.copyfile(jconnect_path, jdbc_binding_path)
 
         # Load YCSB records
+        # Inserts are batched during the load only; the measured run keeps
+        # one round trip per operation.
         load_cmd = ("./bin/ycsb load jdbc -s -P workloads/workloada -p "
                     "db.driver=com.mysql.jdbc.Driver -p "
-                    "db.url=jdbc:mysql://localhost:3306/ycsb?useSSL=false -p "
-                    'db.user=root -p db.passwd="" -threads {} '
-                    "-p recordcount=1000000".format(threads))
-
-        self.commands.append("Load: " + load_cmd)
-
-        load_ycsb = execute.output(
-            "./bin/ycsb load jdbc -s -P workloads/workloada -p "
-            "db.driver=com.mysql.jdbc.Driver -p "
-            "db.url=jdbc:mysql://localhost:3306/ycsb?useSSL=false -p "
-            'db.user=root -p db.passwd="" -threads {} -p recordcount=1000000'.
-            format(threads),
-            working_dir=self.ycsb_dir,
-            environment=shell_env,
-        )
+                    '"db.url=jdbc:mysql://localhost:3306/ycsb?useSSL=false'
+                    '&rewriteBatchedStatements=true" -p '
+                    'db.user=root -p db.passwd="" -p db.batchsize=1000 '
+                    "-p jdbc.batchupdateapi=true -p jdbc.autocommit=false")
 
-        logging.debug(load_ycsb)
-        if os.path.isfile(mysql_data + "/ycsb.err"):
-            logging.debug(file.read(mysql_data + "/ycsb.err"))
+        load_cmds, load_ycsb = load_partitioned(load_cmd, self.records, threads,
+                                                self.ycsb_dir, shell_env)
+        self.commands.extend("Load: " + cmd for cmd in load_cmds)
+
+        logging.debug("\n".join(o or "" for o in load_ycsb))
+        if os.path.isfile(self.mysql_data + "/ycsb.err"):
+            logging.debug(file.read(self.mysql_data + "/ycsb.err"))
 
         # Stop MySQL service
         if os.path.exists("/tmp/mysql.pid"):
             pid = file.read("/tmp/mysql.pid").strip()
-            execute.kill(pid)
-            execute.kill(pid)
-            execute.kill(pid)
+            execute.terminate(pid, timeout=30)
+
+        if not load_complete(load_ycsb, self.records):
+            prettify.error_message("Loading the YCSB records into MySQL "
+                                   "failed.")
+            return False
+
+        file.write(self.loaded_marker, str(self.records))
+        return True
 
     def run(self, threads):
         """Run YCSB with MySQL three times.
@@ -521,140 +761,66 @@ class SQL:
         Args:
             threads (int): The number of threads on the system.
         """
-        shell_env = os.environ.copy()
-        maven_dir = self.src_dir + "/maven"
-        error = False
+        if self.shell_env is None:
+            self.shell_env = maven_environment(self.src_dir)
+        shell_env = self.shell_env
         results = {"unit": {"throughput": "ops/sec", "latency": "us"}}
 
-        if os.path.isdir(maven_dir):
-            shell_env["M2_HOME"] = maven_dir
-            shell_env["M2"] = maven_dir + "/bin"
-        else:
+        if shell_env is None:
             return {"error": "Maven not found."}
 
-        mysql_dir = self.src_dir + "/mysql"
-        mysql_data = mysql_dir + "/mysql-files"
-
-        if not os.path.exists(mysql_data + "/ycsb"):
-            text = 'Unable to find "ycsb" table in MySQL.'
+        if not os.path.isfile(self.loaded_marker):
+            text = 'Unable to find loaded "ycsb" table in MySQL.'
             prettify.error_message(text)
             return {"error": text}
 
         os.makedirs(self.results_dir, exist_ok=True)
 
         # Start MySQL service
-        subprocess.Popen(
-            "{0}/bin/mysqld_safe --user=root --basedir={0} --datadir={1} "
-            "--plugin-dir={0}/lib/plugin --pid-file=/tmp/mysql.pid "
-            "--log-error=ycsb.err &".format(mysql_dir, mysql_data),
-            cwd=mysql_dir,
-            shell=True,
+        mysqld_safe = subprocess.Popen(
+            [
+                self.mysql_dir + "/bin/mysqld_safe",
+                "--user=root",
+                "--basedir=" + self.mysql_dir,
+                "--datadir=" + self.mysql_data,
+                "--plugin-dir={}/lib/plugin".format(self.mysql_dir),
+                "--pid-file=/tmp/mysql.pid",
+                "--log-error=ycsb.err",
+            ],
+            cwd=self.mysql_dir,
             env=shell_env,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
-        time.sleep(20)
 
-        read_latency_results = []
-        update_latency_results = []
-        throughput_results = []
+        if not execute.wait_for_port(3306) or not execute.alive(
+                file.read("/tmp/mysql.pid")):
+            self.__stop_mysql(mysqld_safe)
+            text = "MySQL failed to start."
+            prettify.error_message(text)
+            return {"error": text}
 
         run_cmd = ("./bin/ycsb run jdbc -s -P workloads/workloada -p "
                    "db.driver=com.mysql.jdbc.Driver -p "
                    "db.url=jdbc:mysql://localhost:3306/ycsb?useSSL=false -p "
                    'db.user=root -p db.passwd="" -threads {} -p '
-                   "operationcount=1000000".format(threads))
-
-        self.commands.append("Run: " + run_cmd)
-
-        for count in range(1, 4):
-            run_num = "run" + str(count)
-            result_file = "{}/ycsb-sql_{}.txt".format(self.results_dir, run_num)
-
-            optimize.prerun()
-            time.sleep(10)
-
-            # Run YCSB
-            output = execute.output(run_cmd,
-                                    working_dir=self.ycsb_dir,
-                                    environment=shell_env)
+                   "operationcount=1000000".format(
+                       min(threads * CLIENTS_PER_THREAD, MYSQL_MAX_CLIENTS)))
 
-            file.write(result_file, output)
-
-            if "UPDATE-FAILED" in output or "READ-FAILED" in output:
-                error = True
-                break
-
-            throughput_line = grep.text(output,
-                                        r"\[OVERALL\], Throughput\(ops/sec\),")
-            if throughput_line:
-                throughput = float(throughput_line[-1].split(",")[2].strip())
-                throughput_results.append(throughput)
-
-            readlat_line = grep.text(output,
-                                     r"\[READ\], 95thPercentileLatency\(us\),")
-            if readlat_line:
-                readlat = float(readlat_line[-1].split(",")[2].strip())
-                read_latency_results.append(readlat)
-
-            updatelat_line = grep.text(
-                output, r"\[UPDATE\], 95thPercentileLatency\(us\),")
-            if updatelat_line:
-                updatelat = float(updatelat_line[-1].split(",")[2].strip())
-                update_latency_results.append(updatelat)
-
-            if throughput_line and readlat_line and updatelat_line:
-                results[run_num] = {
-                    "throughput": throughput,
-                    "read_latency": readlat,
-                    "update_latency": updatelat,
-                }
+        run_cmds, run_results = run_iterations(run_cmd, self.ycsb_dir,
+                                               self.results_dir, "ycsb-sql",
+                                               shell_env)
+        self.commands.extend("Run: " + cmd for cmd in run_cmds)
 
         # Stop MySQL service
         if os.path.exists("/tmp/mysql.pid"):
             pid = file.read("/tmp/mysql.pid").strip()
-            execute.kill(pid)
-            execute.kill(pid)
-            execute.kill(pid)
-
-        if error:
-            return {"error": "YCSB failed to update and/or read database."}
-
-        if "run1" in results:
-            results["average"] = {}
-            results["median"] = {}
-            results["variance"] = {}
-            results["range"] = {}
-
-            results["average"]["throughput"] = statistics.mean(
-                throughput_results)
-            results["median"]["throughput"] = statistics.median(
-                throughput_results)
-            results["variance"]["throughput"] = statistics.variance(
-                throughput_results)
-            sorted_throughput = sorted(throughput_results)
-            results["range"]["throughput"] = (sorted_throughput[-1] -
-                                              sorted_throughput[0])
-
-            results["average"]["read_latency"] = statistics.mean(
-                read_latency_results)
-            results["median"]["read_latency"] = statistics.median(
-                read_latency_results)
-            results["variance"]["read_latency"] = statistics.variance(
-                read_latency_results)
-            sorted_read_latency = sorted(read_latency_results)
-            results["range"]["read_latency"] = (sorted_read_latency[-1] -
-                                                sorted_read_latency[0])
-
-            results["average"]["update_latency"] = statistics.mean(
-                update_latency_results)
-            results["median"]["update_latency"] = statistics.median(
-                update_latency_results)
-            results["variance"]["update_latency"] = statistics.variance(
-                update_latency_results)
-            sorted_update_latency = sorted(update_latency_results)
-            results["range"]["update_latency"] = (sorted_update_latency[-1] -
-                                                  sorted_update_latency[0])
+            execute.terminate(pid, timeout=30)
+
+        if "error" in run_results:
+            return run_results
+        results.update(run_results)
 
         logging.info("YCSB MySQL results: %s", str(results))
 
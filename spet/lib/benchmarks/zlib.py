@@ -2,21 +2,26 @@
 """Zlib compression and decompression benchmarking.
 
 This module handles the downloading, extracting, setting up, building,
-and running compilation speed tests for zlib.
+and running compilation speed tests for zlib. zlib-ng is built in its zlib
+compatible mode, since its SIMD CRC32, adler32, and match copy loops are
+what current distributions and applications ship.
 """
 
+import concurrent.futures
+import functools
 import logging
 import os
-import statistics
-import time
+import shlex
+import shutil
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
 from spet.lib.utilities import file
 from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
-from spet.lib.utilities import
+from spet.lib.utilities import stats
 
 
 class Zlib:
@@ -24,26 +29,35 @@ class Zlib:
 
     Notes:
         * Requires `gcc` to be installed.
+        * The "libdeflate" engine requires the libdeflate prerequisite.
 
     Args:
-        version (str): Version number for zlib.
+        version (str): Version number for zlib-ng.
         root_dir (str): The main directory for SPET.
         results_dir (str): The SPET run's result directory.
+        engine (str, optional): "zlib" to stream through zlib-ng's
+            `minigzip`, or "libdeflate" to compress the whole corpus in one
+            shot with `libdeflate-gzip`.
 
     Attributes:
-        version (str): Version number for zlib.
+        version (str): Version number for zlib-ng.
         src_dir (str): The source directory for installing packages.
-        zlib_dir (str): The source directory for the zlib.
+        zlib_dir (str): The source directory for the zlib-ng.
         results_dir (str): The results directory for the zlib results.
         corpus_dir (str): The source directory for the corpus.
+        engine (str): The DEFLATE implementation to benchmark.
+        libdeflate_bin (str): The `libdeflate-gzip` binary.
     """
 
-    def __init__(self, version, root_dir, results_dir):
+    def __init__(self, version, root_dir, results_dir, engine="zlib"):
         self.version = version
         self.src_dir = root_dir + "/src"
-        self.zlib_dir = self.src_dir + "/zlib"
+        self.zlib_dir = self.src_dir + "/zlib-ng"
         self.results_dir = results_dir + "/zlib"
         self.corpus_dir = self.src_dir + "/corpus"
+        self.engine = engine
+        self.libdeflate_bin = (self.src_dir +
+                               "/libdeflate/build/programs/libdeflate-gzip")
         self.commands = []
 
     def create_corpus(self):
@@ -58,13 +72,14 @@ class Zlib:
         logging.debug("Created corpus file.")
 
     def download(self):
-        """Download zlib.
+        """Download zlib-ng.
 
         Returns:
             Boolean: True if download was successful otherwise False.
         """
-        url = "https://zlib.net/zlib-{}.tar.gz".format(self.version)
-        archive_path = "{}/zlib-{}.tar.gz".format(self.src_dir, self.version)
+        url = ("https://github.com/zlib-ng/zlib-ng/archive/refs/tags/"
+               "{}.tar.gz".format(self.version))
+        archive_path = "{}/zlib-ng-{}.tar.gz".format(self.src_dir, self.version)
 
         if os.path.isfile(archive_path):
             logging.debug('"%s" exists, exiting early.', archive_path)
@@ -80,12 +95,12 @@ class Zlib:
         return False
 
     def extract(self):
-        """Extract zlib.
+        """Extract zlib-ng.
 
         Returns:
             Boolean: True if extraction was successful otherwise False.
         """
-        file_path = "{}/zlib-{}.tar.gz".format(self.src_dir, self.version)
+        file_path = "{}/zlib-ng-{}.tar.gz".format(self.src_dir, self.version)
 
         if os.path.isdir(self.zlib_dir):
             logging.debug('"%s" exists, exiting early.', self.zlib_dir)
@@ -102,34 +117,52 @@ class Zlib:
 
         logging.debug('Renaming "%s-%s" to "%s".', self.zlib_dir, self.version,
                       self.zlib_dir)
-        os.rename("{}-{}".format(self.zlib_dir, self.version), self.zlib_dir)
+        try:
+            os.replace("{}-{}".format(self.zlib_dir, self.version),
+                       self.zlib_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
-    def build(self, cores=None, cflags=None):
-        """Compiles zlib.
+    def build(self, cores=None, cflags=None, pgo=False):
+        """Compiles zlib-ng with its zlib compatible API.
 
         Args:
             cores (int, optional): The number of cores on the system.
             cflags (str, optional): The CFLAGS for GCC.
+            pgo (bool, optional): Whether to build twice, profiling the
+                first build on the corpus to optimize the second.
 
         Returns:
             Boolean: True if compilation was successful otherwise False.
         """
+        if self.engine == "libdeflate":
+            # Built with the other prerequisites.
+            if self.__program() is not None:
+                return True
+            prettify.error_message('Cannot use libdeflate because "{}" could '
+                                   "not be found.".format(self.libdeflate_bin))
+            return False
+
         if cores is None:
             cores = 1
         if cflags is None:
             cflags = "-march=native -mtune=native"
         if "-O" not in cflags:
             cflags += " -O3 "
+        # Lets GCC inline the checksum and match loops into deflate/inflate.
+        # Fat objects keep the static library usable without the LTO plugin.
+        cflags += " -flto -ffat-lto-objects "
 
-        bin32_loc = self.zlib_dir + "/minigzip"
-        bin64_loc = self.zlib_dir + "/minigzip64"
         shell_env = os.environ.copy()
 
         shell_env["CFLAGS"] = cflags
+        shell_env["LDFLAGS"] = "-flto"
 
         logging.debug("CFLAGS: %s", shell_env["CFLAGS"])
 
-        if os.path.isfile(bin32_loc) or os.path.isfile(bin64_loc):
+        if self.__program() is not None:
             return True
 
         if not os.path.isdir(self.zlib_dir):
@@ -140,20 +173,198 @@ class Zlib:
         logging.info('Compiling zlib with %d Make threads, and "%s" CFLAGS.',
                      cores, cflags)
 
-        cmd = "./configure && make -j " + str(cores)
+        # `--native` selects the SIMD CRC32, adler32, and chunk copy paths
+        # for this CPU rather than dispatching at runtime.
+        cmd = "./configure --zlib-compat --native && make -j " + str(cores)
+
+        if pgo:
+            profile_dir = self.zlib_dir + "/pgo"
+            shell_env["CFLAGS"] = "{} -fprofile-generate={}".format(
+                cflags, profile_dir)
+            shell_env["LDFLAGS"] = "-flto -fprofile-generate=" + profile_dir
+
+            self.commands.append("Build - Profile: CFLAGS = " +
+                                 shell_env["CFLAGS"])
+            self.commands.append("Build - Profile: " + cmd)
+            execute.output(cmd, self.zlib_dir, environment=shell_env)
+
+            program = self.__program()
+            if program is None:
+                return False
+
+            corpus_file = self.corpus_dir + "/corpus.txt"
+            if not os.path.isfile(corpus_file):
+                self.create_corpus()
+            # The first 100 MiB of the corpus is enough to profile on.
+            train_cmd = (
+                "head -c 104857600 {1} | {0} -6 | {0} -d > /dev/null".format(
+                    program, corpus_file))
+            self.commands.append("Build - Profile: " + train_cmd)
+            execute.output(train_cmd, self.corpus_dir)
+            execute.output("make clean", self.zlib_dir, environment=shell_env)
+
+            cflags = "{} -fprofile-use={} -fprofile-correction".format(
+                cflags, profile_dir)
+            shell_env["CFLAGS"] = cflags
+            shell_env["LDFLAGS"] = "-flto"
 
         self.commands.append("Build: CFLAGS = " + cflags)
         self.commands.append("Build: " + cmd)
 
         execute.output(cmd, self.zlib_dir, environment=shell_env)
 
-        if not os.path.isfile(bin32_loc) or not os.path.isfile(bin64_loc):
-            return False
-        return True
+        if self.__program() is not None:
+            return True
+        return False
+
+    def __program(self):
+        """The built compression program for the engine.
+
+        Returns:
+            String: The first binary found, preferring `minigzip64` over
+            `minigzip`, otherwise None.
+        """
+        if self.engine == "libdeflate":
+            candidates = [self.libdeflate_bin]
+        else:
+            candidates = [
+                self.zlib_dir + "/minigzip64", self.zlib_dir + "/minigzip"
+            ]
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def __single_run(self,
+                     used_bin,
+                     level,
+                     corpus_file,
+                     count,
+                     bind="",
+                     settle=True):
+        """Time one compression and decompression of the corpus.
+
+        Args:
+            used_bin (str): The compression program.
+            level (int): The compression level.
+            corpus_file (str): The corpus to compress.
+            count (int): The run number.
+            bind (str, optional): A command prefix pinning the run.
+            settle (bool, optional): Whether to drop caches and wait for the
+                system to go idle before each timed step. Overlapping runs
+                settle once beforehand instead, since dropping caches or
+                waiting on the load average mid-run would disturb the others.
+
+        Returns:
+            Tuple: (compress, decompress) times.
+        """
+        run_num = "run" + str(count)
+        result_file = "{}/zlib_{}.txt".format(self.results_dir, run_num)
+        working_dir = os.path.dirname(corpus_file)
+        # Runs may overlap, so each writes its own archive.
+        corpus_archive = "{}.{}.zlib".format(corpus_file, run_num)
+
+        compress_cmd = "{}{} -{} < {} > {}".format(bind, used_bin, level,
+                                                   corpus_file, corpus_archive)
+        decompress_warmup = "{}{} -d < {} > /dev/null".format(
+            bind, used_bin, corpus_archive)
+        decompress_cmd = "{}{} -d < {} > /dev/null".format(
+            bind, used_bin, corpus_archive)
+
+        if count == 1 or bind:
+            self.commands.append(
+                "Run - Warmup: cat {} > /dev/null".format(corpus_file))
+            self.commands.append("Run: " + compress_cmd)
+            self.commands.append("Run - Warmup: " + decompress_warmup)
+            self.commands.append("Run: " + decompress_cmd)
+
+        if settle:
+            optimize.prerun()
+            optimize.wait_until_quiesced()
+
+        # warm up; only the corpus needs to be cached before compressing.
+        file.willneed(corpus_file)
+
+        # The timed runs skip the shell, so only the program is measured.
+        program = shlex.split(bind + used_bin)
+        compress_time = execute.timed_args(program + ["-" + str(level)],
+                                           working_dir,
+                                           stdin_path=corpus_file,
+                                           stdout_path=corpus_archive)
+
+        if settle:
+            optimize.prerun()
+            optimize.wait_until_quiesced()
+
+        # warm up
+        execute.output(decompress_warmup, working_dir)
+
+        decompress_time = execute.timed_args(program + ["-d"],
+                                             working_dir,
+                                             stdin_path=corpus_archive)
+
+        os.remove(corpus_archive)
+
+        file.write(
+            result_file,
+            "Compress Time (Level {}):  {}\n"
+            "Decompress Time:          {}\n".format(level, compress_time,
+                                                    decompress_time),
+        )
+
+        return compress_time, decompress_time
+
+    @staticmethod
+    def __stage_corpus(corpus_file, runs):
+        """Copy the corpus to tmpfs so the timed runs do not touch the disk.
+
+        Args:
+            corpus_file (str): The corpus on disk.
+            runs (int): The number of runs, each writing its own archive.
 
-    def run(self):
+        Returns:
+            String: The staged corpus, otherwise `corpus_file` if `/dev/shm`
+            is missing or too small.
+        """
+        shm_dir = "/dev/shm"
+        if not os.path.isdir(shm_dir):
+            return corpus_file
+
+        # Room for the corpus and an incompressible archive per run.
+        needed = os.path.getsize(corpus_file) * (runs + 1)
+        if shutil.disk_usage(shm_dir).free < needed:
+            logging.debug('Not enough space in "%s" for the corpus.', shm_dir)
+            return corpus_file
+
+        staged_corpus = shm_dir + "/spet_corpus.txt"
+        shutil.copyfile(corpus_file, staged_corpus)
+        return staged_corpus
+
+    @staticmethod
+    def __bind_cmd(cpu_id):
+        """Command prefix pinning a run and its memory to one processor.
+
+        Args:
+            cpu_id (int): The processor id.
+
+        Returns:
+            Str: A `numactl` prefix allocating memory on the processor's local
+            node, or a `taskset` prefix when `numactl` is unavailable.
+        """
+        if shutil.which("numactl"):
+            return "numactl --localalloc --physcpubind={}".format(cpu_id)
+
+        return "taskset -c {}".format(cpu_id)
+
+    def run(self, parallel=False):
         """Run zlib compression (level 6) and decompression three times.
 
+        Args:
+            parallel (bool, optional): Whether to run the three iterations at
+                the same time, each pinned to a different processor. This
+                shortens the benchmark, but the runs share caches and memory
+                bandwidth.
+
         Returns:
             If success, a dict containing (unit, run1, run2, run3, average,
             median).
@@ -186,18 +397,17 @@ class Zlib:
 
                 error (str): Error message.
         """
-        bin32_loc = self.zlib_dir + "/minigzip"
-        bin64_loc = self.zlib_dir + "/minigzip64"
         level = 6
         corpus_file = self.corpus_dir + "/corpus.txt"
-        corpus_archive = corpus_file + ".zlib"
         results = {"unit": "s"}
         compress_times = []
         decompress_times = []
 
-        if not os.path.isfile(bin32_loc) or not os.path.isfile(bin64_loc):
-            text = ('Cannot run zlib because neither "{}" or "{}" could not be'
-                    " found.".format(bin32_loc, bin64_loc))
+        used_bin = self.__program()
+
+        if used_bin is None:
+            text = ('Cannot run zlib because the {} program could not be found.'
+                    .format(self.engine))
             prettify.error_message(text)
             return {"error": text}
 
@@ -206,53 +416,42 @@ class Zlib:
 
         logging.info("Running zlib.")
 
-        used_bin = bin64_loc
-
-        if not os.path.isfile(bin64_loc):
-            used_bin = bin32_loc
+        if self.engine == "libdeflate":
+            # Reads and writes whole buffers, so `-c` is needed for stdout.
+            used_bin += " -c"
 
         os.makedirs(self.results_dir, exist_ok=True)
 
-        compress_warmup = "{} -1 < {} > /dev/null".format(used_bin, corpus_file)
-        compress_cmd = "{} -{} < {} > {}".format(used_bin, level, corpus_file,
-                                                 corpus_archive)
-        decompress_warmup = "{} -d < {} > /dev/null".format(
-            used_bin, corpus_archive)
-        decompress_cmd = "{} -d < {} > /dev/null".format(
-            used_bin, corpus_archive)
-
-        self.commands.append("Run - Warmup: " + compress_warmup)
-        self.commands.append("Run: " + compress_cmd)
-        self.commands.append("Run - Warmup: " + decompress_warmup)
-        self.commands.append("Run: " + decompress_cmd)
-
-        for count in range(1, 4):
-            run_num = "run" + str(count)
-            result_file = "{}/zlib_{}.txt".format(self.results_dir, run_num)
-
-            optimize.prerun()
-            time.sleep(10)
-
-            # warm up
-            execute.output(compress_warmup, self.corpus_dir)
-
-            compress_time = execute.timed(compress_cmd, self.corpus_dir)
-
+        runs = range(1, 4)
+        binds = ["" for _ in runs]
+        if parallel:
+            # Each run gets its own processor, spread over the whole machine
+            # so they land on separate cores and, where present, nodes.
+            binds = [
+                self.__bind_cmd(index * cpu.count() // len(runs)) + " "
+                for index in range(len(runs))
+            ]
+
+        staged_corpus = self.__stage_corpus(corpus_file, len(runs))
+        if parallel:
             optimize.prerun()
-            time.sleep(10)
-
-            # warm up
-            execute.output(decompress_warmup, self.corpus_dir)
-
-            decompress_time = execute.timed(decompress_cmd, self.corpus_dir)
-
-            file.write(
-                result_file,
-                "Compress Time (Level {}):  {}\n"
-                "Decompress Time:          {}\n".format(level, compress_time,
-                                                        decompress_time),
-            )
-
+            optimize.wait_until_quiesced()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(runs) if parallel else 1) as executor:
+                times = list(
+                    executor.map(
+                        functools.partial(self.__single_run,
+                                          used_bin,
+                                          level,
+                                          staged_corpus,
+                                          settle=not parallel), runs, binds))
+        finally:
+            if staged_corpus != corpus_file:
+                os.remove(staged_corpus)
+
+        for count, (compress_time, decompress_time) in zip(runs, times):
+            run_num = "run" + str(count)
             compress_times.append(compress_time)
             decompress_times.append(decompress_time)
 
@@ -260,25 +459,12 @@ class Zlib:
             results[run_num]["compress"] = compress_time
             results[run_num]["decompress"] = decompress_time
 
-        os.remove(corpus_archive)
-
-        results["average"] = {}
-        results["average"]["compress"] = statistics.mean(compress_times)
-        results["average"]["decompress"] = statistics.mean(decompress_times)
-        results["median"] = {}
-        results["median"]["compress"] = statistics.median(compress_times)
-        results["median"]["decompress"] = statistics.median(decompress_times)
-        results["variance"] = {}
-        results["variance"]["compress"] = statistics.variance(compress_times)
-        results["variance"]["decompress"] = statistics.variance(
-            decompress_times)
-        results["range"] = {}
-        sorted_compress_times = sorted(compress_times)
-        sorted_decompress_times = sorted(decompress_times)
-        results["range"]["compress"] = (sorted_compress_times[-1] -
-                                        sorted_compress_times[0])
-        results["range"]["decompress"] = (sorted_decompress_times[-1] -
-                                          sorted_decompress_times[0])
+        for stat in ("average", "median", "variance", "range"):
+            results[stat] = {}
+        for direction, times in (("compress", compress_times),
+                                 ("decompress", decompress_times)):
+            for stat, value in stats.summarize(times).items():
+                results[stat][direction] = value
 
         logging.info("zlib results: %s", str(results))
 
@@ -54,6 +54,41 @@ class Options:
             help="Enable AVX-512 for LINPACK.",
             action="store_true",
         )
+        self.parser.add_argument(
+            "--no-cache-artifacts",
+            help="Do not reuse cached downloads and generated files.",
+            action="store_false",
+            dest="cache_artifacts",
+        )
+        self.parser.add_argument(
+            "--kernel-mode",
+            help="Rebuild the whole Linux kernel every run (cold), or only "
+            "the kernel/ subsystem after the first run (warm).",
+            choices=("cold", "warm"),
+            default="cold",
+        )
+        self.parser.add_argument(
+            "--cold-cache-every-run",
+            help="Drop caches before every timed Linux kernel compilation.",
+            action="store_true",
+        )
+        self.parser.add_argument(
+            "--zlib-engine",
+            help="DEFLATE implementation for the zlib benchmark.",
+            choices=("zlib", "libdeflate"),
+            default="zlib",
+        )
+        self.parser.add_argument(
+            "--parallel-runs",
+            help="Run the zlib iterations at the same time, each pinned to "
+            "its own processor.",
+            action="store_true",
+        )
+        self.parser.add_argument(
+            "--pgo",
+            help="Build zlib with profile-guided optimization.",
+            action="store_true",
+        )
 
     def parse(self, args=None):
         """Parse known and unknown `args`.
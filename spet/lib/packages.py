@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
-"""Packages to be installed by the system package manager."""
+"""Packages to be installed by the system package manager.
+
+Each tuple is installed in order, one package at a time, so a package the
+distribution lacks does not stop the rest from installing. Order matters,
+e.g. `epel-release` must come before the packages it provides.
+"""
 
 ZYPPER = (
     "gawk",
@@ -7,6 +12,7 @@ ZYPPER = (
     "-t pattern devel_basis",
     "gcc",
     "gcc-fortran",
+    "cmake",
     "util-linux",
     "R-base",
     "bc",
@@ -23,6 +29,7 @@ YUM = (
     "coreutils",
     "gcc",
     "gcc-gfortran",
+    "cmake",
     "util-linux",
     "R",
     "R-littler",
@@ -39,6 +46,7 @@ APT = (
     "build-essential",
     "gcc",
     "gfortran",
+    "cmake",
     "util-linux",
     "r-base",
     "littler",
@@ -55,6 +63,7 @@ UNKNOWN = (
     '"make" and other development tools for building packages',
     "gcc",
     "gfortran",
+    "cmake",
     "util-linux",
     '"littler" package for R',
     "bc",
@@ -76,8 +76,9 @@ class BLIS:
 
         extract.tar(file_path, self.src_dir)
         extracted_name = self.src_dir + "/amd-blis-" + self.version.lower()
-        os.rename(extracted_name, self.blis_dir)
-
-        if os.path.isdir(self.blis_dir):
-            return True
-        return False
+        try:
+            os.replace(extracted_name, self.blis_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
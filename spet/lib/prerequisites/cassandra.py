@@ -70,8 +70,9 @@ class Cassandra:
         logging.info("Extracting Cassandra.")
 
         extract.tar(file_path, self.src_dir)
-        os.rename(dir_path, self.cassandra_dir)
-
-        if os.path.isdir(self.cassandra_dir):
-            return True
-        return False
+        try:
+            os.replace(dir_path, self.cassandra_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
@@ -69,11 +69,13 @@ class GLibC:
         logging.info("Extracting glibc.")
 
         extract.tar(file_path, self.src_dir)
-        os.rename("{}-{}".format(self.glibc_dir, self.version), self.glibc_dir)
-
-        if os.path.isdir(self.glibc_dir):
-            return True
-        return False
+        try:
+            os.replace("{}-{}".format(self.glibc_dir, self.version),
+                       self.glibc_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
     def build(self, cores=None, cflags=None):
         """Compiles glibc.
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""libdeflate prerequisite."""
+
+import logging
+import os
+
+from spet.lib.utilities import download
+from spet.lib.utilities import execute
+from spet.lib.utilities import extract
+from spet.lib.utilities import prettify
+
+
+class LibDeflate:
+    """libdeflate prerequisite.
+
+    Notes:
+        * Requires `cmake` to be installed.
+
+    Args:
+        version (str): Version number for libdeflate
+        root_dir (str): The main directory for SPET.
+
+    Attributes:
+        version (str): Version number for libdeflate.
+        src_dir (str): The source directory for installing packages.
+        libdeflate_dir (str): The source directory for libdeflate.
+        bin_loc (str): The `libdeflate-gzip` binary.
+    """
+
+    def __init__(self, version, root_dir):
+        self.version = version
+        self.src_dir = root_dir + "/src"
+        self.libdeflate_dir = self.src_dir + "/libdeflate"
+        self.bin_loc = self.libdeflate_dir + "/build/programs/libdeflate-gzip"
+
+    def download(self):
+        """Download libdeflate.
+
+        Returns:
+            Boolean: True if download was successful otherwise False.
+        """
+        url = (
+            "https://github.com/ebiggers/libdeflate/archive/v{}.tar.gz".format(
+                self.version))
+        archive_path = "{}/libdeflate-{}.tar.gz".format(self.src_dir,
+                                                        self.version)
+
+        if os.path.isfile(archive_path):
+            return True
+
+        logging.info("Downloading libdeflate.")
+        logging.debug("URL: %s", url)
+
+        download.file(url, archive_path)
+
+        if os.path.isfile(archive_path):
+            return True
+        return False
+
+    def extract(self):
+        """Extract libdeflate.
+
+        Returns:
+            Boolean: True if extraction was successful otherwise False.
+        """
+        file_path = "{}/libdeflate-{}.tar.gz".format(self.src_dir, self.version)
+
+        if os.path.isdir(self.libdeflate_dir):
+            return True
+
+        if not os.path.isfile(file_path):
+            prettify.error_message(
+                'Cannot extract libdeflate because "{}" could not be found.'.
+                format(file_path))
+            return False
+
+        logging.info("Extracting libdeflate.")
+        extract.tar(file_path, self.src_dir)
+        try:
+            os.replace("{}/libdeflate-{}".format(self.src_dir, self.version),
+                       self.libdeflate_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
+
+    def build(self, cores=None, cflags=None):
+        """Compiles libdeflate and its `libdeflate-gzip` program.
+
+        Args:
+            cores (int, optional): The number of cores on the system.
+            cflags (str, optional): The CFLAGS for GCC.
+
+        Returns:
+            Boolean: True if compilation was successful otherwise False.
+        """
+        if cores is None:
+            cores = 1
+        if cflags is None:
+            cflags = "-march=native -mtune=native"
+        if "-O" not in cflags:
+            cflags += " -O3 "
+
+        shell_env = os.environ.copy()
+        shell_env["CFLAGS"] = cflags
+
+        if os.path.isfile(self.bin_loc):
+            return True
+
+        if not os.path.isdir(self.libdeflate_dir):
+            prettify.error_message(
+                'Cannot compile libdeflate because "{}" could not be found.'.
+                format(self.libdeflate_dir))
+            return False
+
+        logging.info(
+            'Compiling libdeflate with %d Make threads, and "%s" '
+            "CFLAGS.", cores, cflags)
+
+        execute.output(
+            "cmake -B build -DCMAKE_BUILD_TYPE=Release "
+            "-DLIBDEFLATE_BUILD_GZIP=ON && cmake --build build -j {}".format(
+                cores),
+            self.libdeflate_dir,
+            environment=shell_env,
+        )
+
+        if os.path.isfile(self.bin_loc):
+            return True
+        return False
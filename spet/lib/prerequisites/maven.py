@@ -71,8 +71,9 @@ class Maven:
         logging.info("Extracting Maven.")
 
         extract.tar(file_path, self.src_dir)
-        os.rename(dir_path, self.maven_dir)
-
-        if os.path.isdir(self.maven_dir):
-            return True
-        return False
+        try:
+            os.replace(dir_path, self.maven_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
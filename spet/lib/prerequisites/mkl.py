@@ -74,11 +74,12 @@ class MKL:
         logging.info("Extracting MKL.")
 
         extract.tar(file_path, self.src_dir)
-        os.rename(dir_path, self.mkl_dir)
-
-        if os.path.isdir(self.mkl_dir):
-            return True
-        return False
+        try:
+            os.replace(dir_path, self.mkl_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
     def install(self):
         """Install MKL.
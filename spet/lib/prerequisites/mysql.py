@@ -76,11 +76,12 @@ class MySQL:
         logging.info("Extracting MySQL.")
 
         extract.tar(file_path, self.src_dir)
-        os.rename(dir_path, self.mysql_dir)
-
-        if os.path.isdir(self.mysql_dir):
-            return True
-        return False
+        try:
+            os.replace(dir_path, self.mysql_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
     def setup(self):
         """Extract MySQL.
@@ -4,6 +4,7 @@
 import logging
 import os
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import download
 from spet.lib.utilities import execute
 from spet.lib.utilities import extract
@@ -70,12 +71,13 @@ class OpenBLAS:
 
         logging.info("Extracting OpenBLAS.")
         extract.tar(file_path, self.src_dir)
-        os.rename("{}/OpenBLAS-{}".format(self.src_dir, self.version),
-                  self.openblas_dir)
-
-        if os.path.isdir(self.openblas_dir):
-            return True
-        return False
+        try:
+            os.replace("{}/OpenBLAS-{}".format(self.src_dir, self.version),
+                       self.openblas_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
     def build(self, threads, cores=None, cflags=None, avx512=None):
         """Compiles OpenBLAS.
@@ -84,7 +86,8 @@ class OpenBLAS:
             threads (int): The number of threads on the system.
             cores (int, optional): The number of cores on the system.
             cflags (str, optional): The CFLAGS for GCC.
-            avx512 (bool, optional): Whether to enable AVX-512 CFLAGS.
+            avx512 (bool, optional): Whether to enable the AVX-512 CFLAGS
+                supported by this CPU.
 
         Returns:
             Boolean: True if compilation was successful otherwise False.
@@ -96,8 +99,7 @@ class OpenBLAS:
         if "-O" not in cflags:
             cflags += " -O3 "
         if avx512 is True:
-            cflags += (" -mavx512f -mavx512cd -mavx512bw -mavx512dq -mavx512vl"
-                       " -mavx512ifma -mavx512vbmi ")
+            cflags += cpu.avx512_cflags()
 
         bin_loc = self.openblas_dir + "/libopenblas.so"
         shell_env = os.environ.copy()
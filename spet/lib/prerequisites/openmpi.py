@@ -72,11 +72,12 @@ class OpenMPI:
 
         logging.info("Extracting OpenMPI.")
         extract.tar(file_path, self.src_dir)
-        os.rename("{}-{}".format(self.mpi_dir, self.version), self.mpi_dir)
-
-        if os.path.isdir(self.mpi_dir):
-            return True
-        return False
+        try:
+            os.replace("{}-{}".format(self.mpi_dir, self.version), self.mpi_dir)
+        except OSError as err:
+            logging.error(err)
+            return False
+        return True
 
     def build(self, cores=None, cflags=None):
         """Compiles OpenMPI.
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 """The detected processor information."""
 
+import functools
 import logging
 import os
 import re
 import shutil
 
+from spet.lib.utilities import cpu
 from spet.lib.utilities import execute
 from spet.lib.utilities import file
 from spet.lib.utilities import grep
@@ -25,13 +27,12 @@ def name():
     cpu_name = None
 
     try:
-        if os.path.exists("/proc/cpuinfo"):
-            cpu_name = grep.file("/proc/cpuinfo", r"^model name\s*:\s*")
+        cpu_name = cpu.info()["model_name"]
 
         logging.debug("/proc/cpuinfo model name: %s", str(cpu_name))
 
         if cpu_name:
-            cpu_name = " ".join(cpu_name[0].strip().split()[3:])
+            cpu_name = " ".join(cpu_name.split())
             return cpu_name
 
         if not shutil.which("lscpu"):
@@ -61,6 +62,7 @@ def name():
         logging.error(err)
 
 
+@functools.lru_cache(maxsize=None)
 def topology():
     """The processor topology.
 
@@ -126,8 +128,8 @@ def topology():
 
             if shutil.which("nproc"):
                 total_threads = execute.output("nproc --all")
-            elif os.path.isfile("/proc/cpuinfo"):
-                total_threads = len(grep.file("/proc/cpuinfo", r"^processor"))
+            elif cpu.info()["threads"]:
+                total_threads = cpu.info()["threads"]
             else:
                 total_threads = execute.output("getconf _NPROCESSORS_ONLN")
 
@@ -269,6 +271,7 @@ def __cache_size_convert(size):
         logging.error(err)
 
 
+@functools.lru_cache(maxsize=None)
 def cache():
     """Processor cache information.
 
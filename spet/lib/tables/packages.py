@@ -69,7 +69,7 @@ def table(packages, processor):
     if packages.linux:
         display += __row_helper("Linux Kernel:", packages.linux)
     if packages.zlib:
-        display += __row_helper("zlib:", packages.zlib)
+        display += __row_helper("zlib-ng:", packages.zlib)
     if packages.cassandra:
         display += __row_helper("Cassandra:", packages.cassandra)
     if packages.ycsb:
@@ -854,6 +854,8 @@ def docker(result):
             unit = str(result["unit"])
         if "average" in result and "times" in result:
             container_count = len(result["times"])
+            if "cold_time" in result:
+                container_count += 1
             value = "{} Containers @ {:.2f}".format(container_count,
                                                     result["average"])
             display += __format_helper(title, value, unit=unit)
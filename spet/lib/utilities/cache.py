@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Contains functions for caching downloaded and generated artifacts."""
+
+import hashlib
+import json
+import logging
+import os
+
+# Checksums already computed this run, keyed by path, size, and mtime, so
+# large archives checked by several benchmarks are only hashed once.
+__DIGESTS = {}
+
+
+def checksum(file_path):
+    """SHA-256 checksum of a file.
+
+    A file is only hashed again if its size or modification time changed.
+
+    Args:
+        file_path (str): The file to hash.
+
+    Returns:
+        String: The hex digest of the file contents.
+    """
+    try:
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if key in __DIGESTS:
+            return __DIGESTS[key]
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(1048576), b""):
+                sha256.update(chunk)
+        __DIGESTS[key] = sha256.hexdigest()
+        return __DIGESTS[key]
+    except IOError as err:
+        logging.debug(err)
+
+
+def verify(file_path, expected_sha256):
+    """Check a file against a known SHA-256 checksum.
+
+    Args:
+        file_path (str): The file to check.
+        expected_sha256 (str): The expected hex digest.
+
+    Returns:
+        Boolean: True if the file matches the checksum otherwise False.
+    """
+    digest = checksum(file_path)
+    if digest is None or digest != expected_sha256.lower():
+        logging.debug('"%s" does not match its checksum.', file_path)
+        return False
+    return True
+
+
+def record(manifest, name, file_path):
+    """Record a cached artifact and its checksum in the manifest.
+
+    Args:
+        manifest (str): The JSON manifest file.
+        name (str): The key to store the artifact under.
+        file_path (str): The cached artifact.
+
+    Returns:
+        String: The checksum of the recorded artifact.
+    """
+    try:
+        entries = {}
+        if os.path.isfile(manifest):
+            with open(manifest) as manifest_file:
+                entries = json.load(manifest_file)
+        digest = checksum(file_path)
+        entries[name] = {"path": file_path, "sha256": digest}
+        os.makedirs(os.path.dirname(manifest), exist_ok=True)
+        with open(manifest, "w") as manifest_file:
+            json.dump(entries, manifest_file, sort_keys=True, indent=4)
+        return digest
+    except ValueError as err:
+        logging.debug(err)
+    except IOError as err:
+        logging.debug(err)
+
+
+def lookup(manifest, name):
+    """Find a cached artifact whose contents still match the manifest.
+
+    Args:
+        manifest (str): The JSON manifest file.
+        name (str): The key the artifact was stored under.
+
+    Returns:
+        String: The path to the artifact, otherwise None.
+    """
+    try:
+        if not os.path.isfile(manifest):
+            return None
+        with open(manifest) as manifest_file:
+            entry = json.load(manifest_file).get(name)
+        if not entry or not os.path.isfile(entry["path"]):
+            return None
+        if checksum(entry["path"]) != entry["sha256"]:
+            logging.debug('Cached "%s" does not match its checksum.',
+                          entry["path"])
+            return None
+        return entry["path"]
+    except (KeyError, ValueError) as err:
+        logging.debug(err)
+    except IOError as err:
+        logging.debug(err)
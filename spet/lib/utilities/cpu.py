@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Contains functions for inspecting the CPUs available to SPET."""
+
+import functools
+import logging
+import os
+import platform
+import re
+
+AVX512_FEATURES = (
+    "avx512f",
+    "avx512cd",
+    "avx512bw",
+    "avx512dq",
+    "avx512vl",
+    "avx512ifma",
+    "avx512vbmi",
+    "avx512er",
+    "avx512pf",
+)
+
+
+def count():
+    """Number of CPUs this process is allowed to run on.
+
+    Returns:
+        Integer: The number of usable logical CPUs.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError) as err:
+        logging.debug(err)
+        return os.cpu_count() or 1
+
+
+def recommended_j(containers=1):
+    """Make job count that keeps every usable CPU busy without oversubscribing.
+
+    Kernel builds are fastest with one job per CPU; adding more only adds
+    scheduling overhead, especially when several builds share the host.
+
+    Args:
+        containers (int, optional): The number of builds running at once.
+
+    Returns:
+        Integer: The number of jobs to pass to `make -j`.
+    """
+    return max(1, count() // max(1, containers))
+
+
+@functools.lru_cache(maxsize=None)
+def info(cpuinfo="/proc/cpuinfo"):
+    """Processor details parsed from a single read of cpuinfo.
+
+    Example:
+        >>> info()["threads"]
+        8
+
+    Args:
+        cpuinfo (str, optional): The cpuinfo file to read.
+
+    Returns:
+        Dict: (model_name, flags, threads, avx512, arch).
+
+            model_name (str): The processor model name, otherwise None.
+            flags (frozenset): The flags of the first processor.
+            threads (int): The number of logical processors listed.
+            avx512 (bool): Whether AVX-512 Foundation is supported.
+            arch (str): The machine architecture.
+    """
+    details = {
+        "model_name": None,
+        "flags": frozenset(),
+        "threads": 0,
+        "avx512": False,
+        "arch": platform.machine(),
+    }
+    try:
+        with open(cpuinfo) as cpuinfo_file:
+            text = cpuinfo_file.read()
+    except IOError as err:
+        logging.debug(err)
+        return details
+
+    model_name = re.search(r"^model name\s*:\s*(.*)$", text, re.M)
+    flags = re.search(r"^flags\s*:\s*(.*)$", text, re.M)
+    if model_name:
+        details["model_name"] = model_name.group(1).strip()
+    if flags:
+        details["flags"] = frozenset(flags.group(1).split())
+    details["threads"] = len(re.findall(r"^processor\s*:", text, re.M))
+    details["avx512"] = "avx512f" in details["flags"]
+    return details
+
+
+def features(cpuinfo="/proc/cpuinfo"):
+    """CPU feature flags reported by the kernel.
+
+    Args:
+        cpuinfo (str, optional): The cpuinfo file to read.
+
+    Returns:
+        Frozenset: The flags of the first processor.
+    """
+    return info(cpuinfo)["flags"]
+
+
+def avx512_cflags(cpuinfo="/proc/cpuinfo"):
+    """GCC flags for the AVX-512 subsets this CPU supports.
+
+    Args:
+        cpuinfo (str, optional): The cpuinfo file to read.
+
+    Returns:
+        String: The `-m` flags, surrounded by spaces.
+    """
+    available = features(cpuinfo)
+    flags = ["-m" + flag for flag in AVX512_FEATURES if flag in available]
+    return " {} ".format(" ".join(flags))
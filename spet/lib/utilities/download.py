@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Contains wrapper functions for downloading items."""
 
+import concurrent.futures
 import logging
 import shutil
 import urllib.request
@@ -20,3 +21,53 @@ def file(url, dest):
             shutil.copyfileobj(resp, out)
     except IOError as err:
         logging.debug(err)
+
+
+def concurrently(downloads, max_workers=4):
+    """Run download callables at the same time.
+
+    Downloads only wait on the network, so they can all be fetched up front.
+    Failures are logged rather than raised, so one bad download does not stop
+    the rest; the caller's own download step reports it.
+
+    Args:
+        downloads (list): Callables that each fetch one archive.
+        max_workers (int, optional): The number of downloads at once.
+
+    Returns:
+        List: Each callable's return value, otherwise None if it raised.
+    """
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        futures = [executor.submit(download) for download in downloads]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as err:  # pylint: disable=broad-except
+                logging.debug(err)
+                results.append(None)
+    return results
+
+
+def published_sha256(url, name):
+    """Look up a file's SHA-256 checksum in a published checksum list.
+
+    Args:
+        url (str): URL of the list, with lines in `sha256sum` format.
+        name (str): The file name to look up.
+
+    Returns:
+        String: The hex digest for the file, otherwise None.
+    """
+    agent = "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11"
+    try:
+        request = urllib.request.Request(url, headers={"User-Agent": agent})
+        with urllib.request.urlopen(request) as resp:
+            for line in resp.read().decode(errors="replace").splitlines():
+                fields = line.split()
+                if len(fields) == 2 and fields[1].lstrip("*") == name:
+                    return fields[0].lower()
+    except IOError as err:
+        logging.debug(err)
+    return None
@@ -3,7 +3,11 @@
 
 import logging
 import os
+import re
+import signal
+import socket
 import subprocess
+import time
 import timeit
 
 
@@ -48,6 +52,68 @@ def output(command, working_dir=None, environment=None):
         logging.debug("Execute error return code: %d", err.returncode)
 
 
+def stream(command, working_dir=None, environment=None):
+    """Executes shell processes and yields output as it is produced.
+
+    Args:
+        command (str): The shell command.
+        working_dir (str, optional): The working directory of the shell
+            command.
+        environment (dict, optional): All environment variables for the shell.
+
+    Example:
+        >>> list(stream('echo "hi"'))
+        ['hi\n']
+
+    Yields:
+        String: Each line of stdout and stderr of the shell process called.
+    """
+    try:
+        shell_env = os.environ.copy()
+        if environment:
+            shell_env.update(environment)
+        with subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=working_dir,
+                shell=True,
+                universal_newlines=True,
+                executable="/bin/bash",
+                env=shell_env,
+        ) as proc:
+            for line in proc.stdout:
+                yield line
+        if proc.returncode:
+            logging.debug("Execute error command: %s", command)
+            logging.debug("Execute error return code: %d", proc.returncode)
+    except IOError as err:
+        logging.debug(err)
+
+
+def wait_for_port(port, host="localhost", timeout=120):
+    """Wait for a server to accept connections.
+
+    Args:
+        port (int): The TCP port the server listens on.
+        host (str, optional): The host the server runs on.
+        timeout (int, optional): The most seconds to wait.
+
+    Returns:
+        Boolean: True if the server accepted a connection otherwise False.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError as err:
+            if time.time() >= deadline:
+                logging.debug(err)
+                return False
+        time.sleep(0.25)
+
+
 def timed(command, working_dir=None, environment=None):
     """Times the execution of the shell process.
 
@@ -91,6 +157,92 @@ def timed(command, working_dir=None, environment=None):
         logging.debug(err)
 
 
+def timed_args(args,
+               working_dir=None,
+               environment=None,
+               stdin_path=None,
+               stdout_path=None):
+    """Times a process started without a shell.
+
+    Unlike `timed`, no shell is started inside the measured window, so short
+    commands are not dominated by shell startup.
+
+    Args:
+        args (list): The program and its arguments.
+        working_dir (str, optional): The working directory of the process.
+        environment (dict, optional): All environment variables for the
+            process.
+        stdin_path (str, optional): File to read stdin from.
+        stdout_path (str, optional): File to write stdout to, otherwise
+            stdout is discarded.
+
+    Example:
+        >>> timed_args(["sleep", "10"])
+        10
+
+    Returns:
+        Float: Wall time of the process, otherwise None if it failed.
+    """
+    clock = getattr(time, "CLOCK_MONOTONIC_RAW", time.CLOCK_MONOTONIC)
+    try:
+        shell_env = os.environ.copy()
+        if environment:
+            shell_env.update(environment)
+
+        stdin = subprocess.DEVNULL
+        stdout = subprocess.DEVNULL
+        try:
+            if stdin_path:
+                stdin = open(stdin_path, "rb")
+            if stdout_path:
+                stdout = open(stdout_path, "wb")
+            start = time.clock_gettime(clock)
+            returncode = subprocess.Popen(args,
+                                          stdin=stdin,
+                                          stdout=stdout,
+                                          stderr=subprocess.DEVNULL,
+                                          cwd=working_dir,
+                                          env=shell_env).wait()
+            elapsed = time.clock_gettime(clock) - start
+        finally:
+            for stream_file in (stdin, stdout):
+                if stream_file is not subprocess.DEVNULL:
+                    stream_file.close()
+
+        if returncode != 0:
+            logging.debug('"%s" failed to complete.', " ".join(args))
+            return None
+        return elapsed
+    except IOError as err:
+        logging.debug(err)
+
+
+def perf_runs(text):
+    """Recovers both run times from a `perf stat -r 2` summary.
+
+    For two repeats `perf stat` reports the mean and the standard error,
+    which is half the difference between the runs.
+
+    Args:
+        text (str): The `perf stat` output.
+
+    Example:
+        >>> perf_runs("  2.5 +- 0.5 seconds time elapsed  ( +- 20.00% )")
+        [2.0, 3.0]
+
+    Returns:
+        List: The two run times, otherwise None if no summary was found.
+    """
+    match = re.search(r"([\d.]+)\s+\+-\s+([\d.]+)\s+seconds time elapsed",
+                      text or "")
+    if not match:
+        return None
+
+    mean = float(match.group(1))
+    spread = float(match.group(2))
+    return [mean - spread, mean + spread]
+
+
 def pkill(process_name):
     """Kills all processes which contain the desired name.
 
@@ -127,3 +279,75 @@ def kill(pid):
         logging.debug("Execute error output: %s", err.output)
         logging.debug("Execute error command: %s", err.cmd)
         logging.debug("Execute error return code: %d", err.returncode)
+
+
+def alive(pid):
+    """Whether a process is running.
+
+    Args:
+        pid (str): The process id to check, or None.
+
+    Returns:
+        Boolean: True if the process exists and has not exited otherwise
+        False.
+    """
+    try:
+        pid = int(pid)
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except (TypeError, ValueError, ProcessLookupError):
+        return False
+    try:
+        # An exited child stays a zombie until its parent reaps it.
+        with open("/proc/{}/stat".format(pid)) as stat:
+            return stat.read().rsplit(")", 1)[-1].split()[0] != "Z"
+    except IOError as err:
+        logging.debug(err)
+        return True
+
+
+def __wait_for_exit(pid, timeout):
+    """Poll until a process exits.
+
+    Args:
+        pid (int): The process id to wait for.
+        timeout (int): Seconds to wait.
+
+    Returns:
+        Boolean: True if the process exited otherwise False.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not alive(pid):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def terminate(pid, timeout=5):
+    """Stop process with desired PID and wait for it to exit.
+
+    Sends SIGTERM and polls for the process to exit, escalating to SIGKILL
+    if it is still alive after the timeout.
+
+    Args:
+        pid (str): The process id to stop.
+        timeout (int, optional): Seconds to wait before sending SIGKILL.
+
+    Returns:
+        Boolean: True if the process exited otherwise False.
+    """
+    try:
+        pid = int(pid)
+        os.kill(pid, signal.SIGTERM)
+        if __wait_for_exit(pid, timeout):
+            return True
+        logging.debug("Process %d ignored SIGTERM. Sending SIGKILL.", pid)
+        os.kill(pid, signal.SIGKILL)
+        return __wait_for_exit(pid, timeout)
+    except ProcessLookupError:
+        return True
+    except (ValueError, PermissionError) as err:
+        logging.debug(err)
+        return False
@@ -2,6 +2,9 @@
 """Contains wrapper functions for extracting archives."""
 
 import logging
+import os
+import shutil
+import subprocess
 import tarfile
 
 
@@ -13,7 +16,30 @@ def tar(archive, output_dir="."):
         output_dir (str, optional): Where the archive is extracted.
     """
     try:
-        if archive.endswith("tar.gz"):
+        gzipped = archive.endswith(("tar.gz", "tgz"))
+        if gzipped and shutil.which("pigz") and shutil.which("tar"):
+            logging.debug("File is a gzipped tar. Inflating with pigz.")
+            # pigz inflates on several threads, unlike Python's gzip module.
+            # Both ends of the pipe are checked, so a corrupt archive is not
+            # hidden behind tar's exit status.
+            pigz = subprocess.Popen(["pigz", "-dc", archive],
+                                    stdout=subprocess.PIPE)
+            untar = subprocess.Popen(["tar", "-xf", "-", "-C", output_dir],
+                                     stdin=pigz.stdout)
+            pigz.stdout.close()
+            untar.wait()
+            pigz.wait()
+            for process in (pigz, untar):
+                if process.returncode != 0:
+                    raise subprocess.CalledProcessError(process.returncode,
+                                                        process.args)
+        elif archive.endswith(("tar.gz", "tgz", "tar")) and shutil.which("tar"):
+            logging.debug("File is a tar. Extracting with tar.")
+            # Native tar avoids parsing every header in Python.
+            subprocess.check_call([
+                "tar", "-xzf" if gzipped else "-xf", archive, "-C", output_dir
+            ])
+        elif archive.endswith("tar.gz"):
             logging.debug('File ends with "tar.gz".')
             file = tarfile.open(archive, "r:gz")
             file.extractall(output_dir)
@@ -30,5 +56,39 @@ def tar(archive, output_dir="."):
                 file.extract(item, output_dir)
                 if not item.name.find(".tgz") or not item.name.find(".tar"):
                     tar(item.name, "./" + item.name[:item.name.rfind("/")])
+    except subprocess.CalledProcessError as err:
+        logging.error(err)
     except IOError as err:
         logging.error(err)
+
+
+def tar_stripped(archive, output_dir, prefix):
+    """Stream a tar.gz archive into a directory, dropping a leading prefix.
+
+    The archive is read in one sequential pass, so no index of its members
+    is built and nothing needs renaming afterwards. A partially extracted
+    directory is removed if extraction fails.
+
+    Args:
+        archive (str): The archive to extract.
+        output_dir (str): Where the archive's contents are extracted.
+        prefix (str): The leading directory to strip, e.g. "hpl-2.2/".
+
+    Returns:
+        Boolean: True if extraction was successful otherwise False.
+    """
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with tarfile.open(archive, mode="r|gz") as stream:
+            for member in stream:
+                if not member.name.startswith(prefix):
+                    continue
+                member.name = member.name[len(prefix):]
+                if member.islnk() and member.linkname.startswith(prefix):
+                    member.linkname = member.linkname[len(prefix):]
+                stream.extract(member, output_dir)
+        return True
+    except (IOError, tarfile.TarError) as err:
+        logging.error(err)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return False
@@ -25,6 +25,28 @@ def read(file_path):
         logging.error(err)
 
 
+def missing(paths):
+    """First path that does not exist.
+
+    Each path is checked with a single `stat` call, in order, so list the
+    deepest paths first; their parents are then known to exist.
+
+    Args:
+        paths (list): The paths to check.
+
+    Returns:
+        String: The first missing path, otherwise None.
+    """
+    for path in paths:
+        try:
+            os.stat(path)
+        except FileNotFoundError:
+            return path
+        except NotADirectoryError:
+            return path
+    return None
+
+
 def touch(file_path):
     """Creates empty file.
 
@@ -62,12 +84,86 @@ def write(file_path, text, append=False):
         logging.error(err)
 
 
+def write_dontneed(file_path, text):
+    """Write text to file without keeping it in the page cache.
+
+    For raw benchmark logs that are written once and never read back, so
+    they do not take page cache away from the next run.
+
+    Args:
+        file_path (str): File to write.
+        text (str): Text to write to file.
+    """
+    try:
+        descriptor = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                             0o644)
+        try:
+            os.write(descriptor, text.encode())
+            __drop_cache(descriptor)
+        finally:
+            os.close(descriptor)
+    except IOError as err:
+        logging.error(err)
+
+
+def dontneed(file_path):
+    """Drop an already written file from the page cache.
+
+    For logs that were streamed to disk line by line, see `write_dontneed`.
+
+    Args:
+        file_path (str): File to drop.
+    """
+    try:
+        descriptor = os.open(file_path, os.O_RDONLY)
+        try:
+            __drop_cache(descriptor)
+        finally:
+            os.close(descriptor)
+    except IOError as err:
+        logging.error(err)
+
+
+def willneed(file_path):
+    """Read a file into the page cache.
+
+    A cheap warmup before timing a program that reads the file.
+
+    Args:
+        file_path (str): File to cache.
+    """
+    try:
+        descriptor = os.open(file_path, os.O_RDONLY)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_WILLNEED)
+            # The advice is asynchronous, so read through to wait for it.
+            while os.read(descriptor, 1048576):
+                pass
+        finally:
+            os.close(descriptor)
+    except IOError as err:
+        logging.error(err)
+
+
+def __drop_cache(descriptor):
+    """Write back and drop the cached pages of an open file.
+
+    Args:
+        descriptor (int): The open file descriptor.
+    """
+    if hasattr(os, "posix_fadvise"):
+        # Dirty pages cannot be dropped until they are written back.
+        os.fdatasync(descriptor)
+        os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
 def replace_line(file_path, pattern, subst):
     """Replace line in file.
 
     Args:
         file_path (str): The file to modify.
-        pattern (str): Pattern in line to search for.
+        pattern (str): Pattern in line to search for. May be precompiled.
         subst (str): What to substitute the pattern with.
     """
     try:
@@ -78,3 +174,29 @@ def replace_line(file_path, pattern, subst):
                 sources.write(re.sub(pattern, subst, line))
     except IOError as err:
         logging.error(err)
+
+
+def replace_lines(file_path, substitutions):
+    """Replace lines in file in a single pass.
+
+    Equivalent to calling `replace_line` once for each substitution, in
+    order, but the file is only read and written once.
+
+    Args:
+        file_path (str): The file to modify.
+        substitutions (list): (pattern, subst) pairs to apply to each line.
+            Patterns may be precompiled.
+    """
+    try:
+        compiled = [
+            (re.compile(pattern), subst) for pattern, subst in substitutions
+        ]
+        with open(file_path, "r") as sources:
+            lines = sources.readlines()
+        with open(file_path, "w") as sources:
+            for line in lines:
+                for pattern, subst in compiled:
+                    line = pattern.sub(subst, line)
+                sources.write(line)
+    except IOError as err:
+        logging.error(err)
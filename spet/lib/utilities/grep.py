@@ -10,17 +10,17 @@ def file(file_path, pattern):
 
     Args:
         file_path (str): The file to search.
-        pattern (str): The search pattern.
+        pattern (str): The search pattern. May be precompiled.
 
     Returns:
         List: All lines containing the pattern.
     """
     try:
         lines = []
+        search = re.compile(pattern).search
         with open(file_path) as origin_file:
             for line in origin_file:
-                found = re.findall(pattern, line)
-                if found:
+                if search(line):
                     lines.append(line)
         logging.debug("lines: %s", str(lines))
         return lines
@@ -33,7 +33,7 @@ def text(body, pattern):
 
     Args:
         body (str): The body of text to search.
-        pattern (str): The search pattern.
+        pattern (str): The search pattern. May be precompiled.
 
     Returns:
         List: All lines containing the pattern.
@@ -44,9 +44,9 @@ def text(body, pattern):
         if not body:
             return []
         lines = body.rstrip().split("\n")
+        search = re.compile(pattern).search
         for line in lines:
-            found = re.findall(pattern, line)
-            if found:
+            if search(line):
                 findings.append(line)
         logging.debug("findings: %s", str(findings))
         return findings
@@ -5,6 +5,7 @@ import logging
 import os
 import re
 import shutil
+import time
 
 import resource
 
@@ -45,6 +46,24 @@ def disable_hugepages():
         logging.debug(err)
 
 
+def enable_hugepages():
+    """Enables transparent hugepages.
+
+    Used by benchmarks with large working sets, such as HPL, which spend
+    much of their time in dTLB misses with 4 KB pages. Call
+    `disable_hugepages` afterwards to restore the SPET default.
+    """
+    transparent_hugepage = "/sys/kernel/mm/transparent_hugepage/enabled"
+
+    try:
+        if os.path.isfile(transparent_hugepage):
+            file.write(transparent_hugepage, "always")
+            return True
+        return False
+    except IOError as err:
+        logging.debug(err)
+
+
 def disable_swap():
     """Disable swap."""
     try:
@@ -74,6 +93,62 @@ def prerun():
         logging.debug(err)
 
 
+def prerun_memory_benchmark():
+    """Prepare the system for a memory bandwidth or latency benchmark.
+
+    Drops the page cache like `prerun` and compacts memory, so the
+    benchmark starts from cold caches and unfragmented free pages.
+    """
+    try:
+        cleared = prerun()
+        compact_memory = "/proc/sys/vm/compact_memory"
+        if os.path.isfile(compact_memory):
+            file.write(compact_memory, "1")
+            cleared = True
+        return cleared
+    except IOError as err:
+        logging.debug(err)
+
+
+def prerun_compute_benchmark():
+    """Prepare the system for a compute bound benchmark.
+
+    Only pins the CPU frequency governor; dropping caches would just add
+    page faults to the start of the benchmark process.
+    """
+    return performance_governor()
+
+
+def wait_until_quiesced(max_sleep=10, load_threshold=None):
+    """Wait for the system to go idle before a benchmark.
+
+    Polls the 1-minute load average and returns as soon as it drops below
+    the threshold, or after `max_sleep` seconds at the latest.
+
+    Args:
+        max_sleep (int, optional): The most seconds to wait.
+        load_threshold (float, optional): The load average counted as idle.
+            Defaults to 0.1 per CPU.
+
+    Returns:
+        Float: The seconds waited.
+    """
+    if load_threshold is None:
+        load_threshold = 0.1 * (os.cpu_count() or 1)
+    start = time.time()
+    deadline = start + max_sleep
+    while time.time() < deadline:
+        try:
+            if os.getloadavg()[0] < load_threshold:
+                break
+        except OSError as err:
+            logging.debug(err)
+            time.sleep(max(0, deadline - time.time()))
+            break
+        time.sleep(0.2)
+    return time.time() - start
+
+
 def ulimit():
     """Sets the `ulimit` values for this and child processes."""
     try:
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Summary statistics of benchmark runs."""
+
+
+def summarize(values):
+    """Average, median, variance, and range of the runs from one sort.
+
+    Args:
+        values (list): The metric from each run.
+
+    Example:
+        >>> summarize([3, 1, 2])
+        {'average': 2.0, 'median': 2, 'variance': 1.0, 'range': 2}
+
+    Returns:
+        Dict: (average, median, variance, range) of the values.
+    """
+    ordered = sorted(values)
+    count = len(ordered)
+    middle = count // 2
+    mean = sum(ordered) / count
+    if count % 2:
+        median = ordered[middle]
+    else:
+        median = (ordered[middle - 1] + ordered[middle]) / 2
+    variance = 0.0
+    if count > 1:
+        variance = sum((value - mean)**2 for value in ordered) / (count - 1)
+    return {
+        "average": mean,
+        "median": median,
+        "variance": variance,
+        "range": ordered[-1] - ordered[0],
+    }
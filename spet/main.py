@@ -6,6 +6,7 @@ Linux command-line application that simplifies building and running multiple
 free to use benchmark tests. Results are stored in the `$HOME` directory.
 """
 
+import functools
 import logging
 import logging.config
 import os
@@ -30,6 +31,7 @@ from .lib.benchmarks import zlib
 from .lib.prerequisites import blis
 from .lib.prerequisites import cassandra
 from .lib.prerequisites import glibc
+from .lib.prerequisites import libdeflate
 from .lib.prerequisites import maven
 from .lib.prerequisites import mkl
 from .lib.prerequisites import mysql
@@ -43,6 +45,7 @@ from .lib.tables import system
 from .lib.tables import commands as commands_table
 from .lib.tables import packages as packages_table
 from .lib.utilities import access
+from .lib.utilities import download
 from .lib.utilities import file
 from .lib.utilities import json_file
 from .lib.utilities import optimize
@@ -76,10 +79,30 @@ def install_prerequisites(root_dir, system_info, opts):
         opts (list): All flag options passed to this module.
     """
     versions = package_versions.PACKAGE_VERSIONS
+    processor_name = system_info.processorName.lower()
+    zlib_included = opts.excludes is None or "zlib" not in opts.excludes
 
-    # OpenMPI
     mpi = openmpi.OpenMPI(versions.openmpi, root_dir)
+    blas = openblas.OpenBLAS(versions.openblas, root_dir)
+    libc = glibc.GLibC(versions.glibc, root_dir)
+    mvn = maven.Maven(versions.maven, root_dir)
+    sql = mysql.MySQL(versions.mysql, versions.mysql_glibc, root_dir)
+    nosql = cassandra.Cassandra(versions.cassandra, root_dir)
+    deflate = libdeflate.LibDeflate(versions.libdeflate, root_dir)
+
+    # MKL and BLIS are downloaded by hand. The download calls below find the
+    # other archives already in place.
+    downloads = [
+        mpi.download, libc.download, mvn.download, sql.download, nosql.download
+    ]
+    if "intel" not in processor_name and "amd" not in processor_name:
+        downloads.append(blas.download)
+    if opts.zlib_engine == "libdeflate" and zlib_included:
+        downloads.append(deflate.download)
 
+    download.concurrently(downloads)
+
+    # OpenMPI
     download_success = mpi.download()
     if not download_success:
         prettify.error_message("OpenMPI failed to download.")
@@ -98,7 +121,7 @@ def install_prerequisites(root_dir, system_info, opts):
         prettify.error_message("OpenMPI failed to install.")
 
     # Math libraries
-    if "intel" in system_info.processorName.lower():
+    if "intel" in processor_name:
         intel = mkl.MKL(versions.mkl, root_dir)
 
         download_success = intel.download()
@@ -112,7 +135,7 @@ def install_prerequisites(root_dir, system_info, opts):
         install_success = intel.install()
         if not install_success:
             prettify.error_message("MKL failed to install.")
-    elif "amd" in system_info.processorName.lower():
+    elif "amd" in processor_name:
         amd = blis.BLIS(versions.blis, root_dir)
 
         download_success = amd.download()
@@ -123,8 +146,6 @@ def install_prerequisites(root_dir, system_info, opts):
         if not extract_success:
             prettify.error_message("BLIS failed to extract.")
     else:
-        blas = openblas.OpenBLAS(versions.openblas, root_dir)
-
         download_success = blas.download()
         if not download_success:
             prettify.error_message("OpenBLAS failed to download.")
@@ -143,8 +164,6 @@ def install_prerequisites(root_dir, system_info, opts):
             prettify.error_message("OpenBLAS failed to compile.")
 
     # Glibc
-    libc = glibc.GLibC(versions.glibc, root_dir)
-
     download_success = libc.download()
     if not download_success:
         prettify.error_message("Glibc failed to download.")
@@ -163,8 +182,6 @@ def install_prerequisites(root_dir, system_info, opts):
         prettify.error_message("Glibc failed to install.")
 
     # Maven
-    mvn = maven.Maven(versions.maven, root_dir)
-
     download_success = mvn.download()
     if not download_success:
         prettify.error_message("Maven failed to download.")
@@ -174,8 +191,6 @@ def install_prerequisites(root_dir, system_info, opts):
         prettify.error_message("Maven failed to extract.")
 
     # MySQL
-    sql = mysql.MySQL(versions.mysql, versions.mysql_glibc, root_dir)
-
     download_success = sql.download()
     if not download_success:
         prettify.error_message("MySQL failed to download.")
@@ -189,8 +204,6 @@ def install_prerequisites(root_dir, system_info, opts):
         prettify.error_message("MySQL failed to setup.")
 
     # Cassandra
-    nosql = cassandra.Cassandra(versions.cassandra, root_dir)
-
     download_success = nosql.download()
     if not download_success:
         prettify.error_message("Cassandra failed to download.")
@@ -199,6 +212,21 @@ def install_prerequisites(root_dir, system_info, opts):
     if not extract_success:
         prettify.error_message("Cassandra failed to extract.")
 
+    # libdeflate
+    if opts.zlib_engine == "libdeflate" and zlib_included:
+        download_success = deflate.download()
+        if not download_success:
+            prettify.error_message("libdeflate failed to download.")
+
+        extract_success = deflate.extract()
+        if not extract_success:
+            prettify.error_message("libdeflate failed to extract.")
+
+        build_success = deflate.build(cores=system_info.cores,
+                                      cflags=system_info.cflags)
+        if not build_success:
+            prettify.error_message("libdeflate failed to compile.")
+
 
 def benchmarks(root_dir, results_dir, system_info, opts):
     """Compile and setup all benchmarks.
@@ -227,7 +255,10 @@ def benchmarks(root_dir, results_dir, system_info, opts):
     crypto = openssl.OpenSSL(versions.openssl, root_dir, results_dir)
     node_lat = mlc.MemoryLatencyChecker(versions.mlc, root_dir, results_dir)
     kernel = compilation.CompilationSpeed(versions.linux, root_dir, results_dir)
-    compression = zlib.Zlib(versions.zlib, root_dir, results_dir)
+    compression = zlib.Zlib(versions.zlib,
+                            root_dir,
+                            results_dir,
+                            engine=opts.zlib_engine)
     hpl = linpack.Linpack(versions.linpack, root_dir, results_dir)
     stream_omp = stream.STREAM(versions.stream, root_dir, results_dir)
     nosql = ycsb.NoSQL(versions.ycsb, root_dir, results_dir)
@@ -237,6 +268,39 @@ def benchmarks(root_dir, results_dir, system_info, opts):
     # Setup
     logging.warning("Setting up and compiling benchmarks...")
 
+    # The download calls below find the archives already in place.
+    included = [
+        name for name in ("lmbench", "openssl", "compilation", "zlib",
+                          "linpack", "stream", "nosql", "sql", "docker")
+        if opts.excludes is None or name not in opts.excludes
+    ]
+    downloads = []
+    if "lmbench" in included:
+        downloads.append(mem_lat_rd.download)
+    if "openssl" in included:
+        downloads.append(crypto.download)
+    if "compilation" in included:
+        downloads.append(
+            functools.partial(kernel.download,
+                              cache_artifacts=opts.cache_artifacts))
+    if "zlib" in included and opts.zlib_engine == "zlib":
+        downloads.append(compression.download)
+    if "linpack" in included:
+        downloads.append(hpl.download)
+    if "stream" in included:
+        downloads.append(stream_omp.download)
+    if "docker" in included:
+        downloads.append(containers.download)
+    # NoSQL and SQL share the YCSB archive, so one downloads after the other.
+    if "nosql" in included and "sql" in included:
+        downloads.append(lambda: (nosql.download(), sql.download()))
+    elif "nosql" in included:
+        downloads.append(nosql.download)
+    elif "sql" in included:
+        downloads.append(sql.download)
+
+    download.concurrently(downloads)
+
     if opts.excludes is None or "lmbench" not in opts.excludes:
         mem_lat_rd.download()
         mem_lat_rd.extract()
@@ -257,14 +321,21 @@ def benchmarks(root_dir, results_dir, system_info, opts):
                      cflags=system_info.cflags)
 
     if opts.excludes is None or "compilation" not in opts.excludes:
-        kernel.download()
+        kernel.download(cache_artifacts=opts.cache_artifacts)
         kernel.extract()
-        kernel.setup(cores=system_info.cores, cflags=system_info.cflags)
+        kernel.setup(
+            cores=system_info.cores,
+            cflags=system_info.cflags,
+            cache_artifacts=opts.cache_artifacts,
+        )
 
     if opts.excludes is None or "zlib" not in opts.excludes:
-        compression.download()
-        compression.extract()
-        compression.build(system_info.cores, cflags=system_info.cflags)
+        if opts.zlib_engine == "zlib":
+            compression.download()
+            compression.extract()
+        compression.build(system_info.cores,
+                          cflags=system_info.cflags,
+                          pgo=opts.pgo)
 
     if opts.excludes is None or "linpack" not in opts.excludes:
         hpl.download()
@@ -311,9 +382,6 @@ def benchmarks(root_dir, results_dir, system_info, opts):
     if opts.excludes is None or "docker" not in opts.excludes:
         containers.download()
         containers.extract()
-        containers.build(versions.linux,
-                         cores=system_info.cores,
-                         cflags=system_info.cflags)
 
     logging.warning("Done setting up and compiling benchmarks.")
 
@@ -356,7 +424,11 @@ def benchmarks(root_dir, results_dir, system_info, opts):
 
     if opts.excludes is None or "compilation" not in opts.excludes:
         results["Timed Kernel Compilation"] = kernel.run(
-            cores=system_info.cores, cflags=system_info.cflags)
+            cores=system_info.cores,
+            cflags=system_info.cflags,
+            mode=opts.kernel_mode,
+            cold_cache_every_run=opts.cold_cache_every_run,
+        )
         commands["Timed Kernel Compilation"] = kernel.commands
     else:
         results["Timed Kernel Compilation"] = {"skipped": True}
@@ -365,7 +437,7 @@ def benchmarks(root_dir, results_dir, system_info, opts):
         results_table.compilation(results["Timed Kernel Compilation"]))
 
     if opts.excludes is None or "zlib" not in opts.excludes:
-        results["zlib"] = compression.run()
+        results["zlib"] = compression.run(parallel=opts.parallel_runs)
         commands["zlib"] = compression.commands
     else:
         results["zlib"] = {"skipped": True}
@@ -407,8 +479,17 @@ def benchmarks(root_dir, results_dir, system_info, opts):
     logging.warning(results_table.sql(results["YCSB SQL"]))
 
     if opts.excludes is None or "docker" not in opts.excludes:
-        results["Docker"] = containers.run(cores=system_info.cores,
-                                           cflags=system_info.cflags)
+        # The daemon only runs for the Docker benchmark, so it cannot skew
+        # the others, and is stopped even if the build or run raises.
+        with containers:
+            containers.build(
+                versions.linux,
+                cores=system_info.cores,
+                cflags=system_info.cflags,
+                cache_artifacts=opts.cache_artifacts,
+            )
+            results["Docker"] = containers.run(cores=system_info.cores,
+                                               cflags=system_info.cflags)
         commands["Docker"] = containers.commands
     else:
         results["Docker"] = {"skipped": True}
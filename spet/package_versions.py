@@ -26,6 +26,7 @@ _packages = collections.namedtuple(
         "openblas",
         "linux",
         "zlib",
+        "libdeflate",
         "cassandra",
         "ycsb",
         "mysql",
@@ -52,7 +53,7 @@ PACKAGE_VERSIONS = _packages(
     # Check https://ftp.gnu.org/gnu/glibc/ for the latest glibc version
     glibc="2.26",
     # Check https://www.openssl.org/source/ for the latest OpenSSL version
-    openssl="1.1.0g",
+    openssl="3.2.1",
     # Check http://www.netlib.org/benchmark/hpl/ for the latest High-
     # Performance Linpack version
     linpack="2.2",
@@ -63,8 +64,12 @@ PACKAGE_VERSIONS = _packages(
     openblas="0.2.20",
     # Check http://www.kernel.org/pub/linux/kernel/ for the latest Linux kernel
     linux="4.14.4",
-    # Check https://zlib.net/ for the latest zlib version
-    zlib="1.2.11",
+    # Check https://github.com/zlib-ng/zlib-ng/releases for the latest zlib-ng
+    # version
+    zlib="2.1.6",
+    # Check https://github.com/ebiggers/libdeflate/releases for the latest
+    # libdeflate version
+    libdeflate="1.19",
     # Check http://cassandra.apache.org/download/ for the latest Cassandra
     # version
     cassandra="3.11.1",
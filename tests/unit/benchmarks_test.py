@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/benchmarks"""
+
+from spet.lib.benchmarks import linpack
+from spet.lib.benchmarks import ycsb
+
+###########
+# linpack
+###########
+
+
+def test_linpack__scale_n():
+    """linpack::__scale_n: should keep the N ladder of earlier SPET runs"""
+    scale_n = linpack.Linpack._Linpack__scale_n
+    assert scale_n(10240, 128) == (896, 1152, 1536, 2048, 2560, 3200, 4096,
+                                   5120, 6528, 8192, 10240)
+    assert scale_n(800, 128) == (800,)
+    assert len(scale_n(10**7, 128)) == 20
+
+
+##########
+# ycsb
+##########
+
+
+def test_ycsb__load_complete():
+    """ycsb::load_complete: should count plain and batched inserts"""
+    plain = "[INSERT], Operations, 2500\n[INSERT], Return=OK, 2500\n"
+    batched = ("[INSERT], Operations, 2500\n"
+               "[INSERT], Return=OK, 3\n"
+               "[INSERT], Return=BATCHED_OK, 2497\n")
+    assert ycsb.load_complete([plain, batched], 5000)
+    assert not ycsb.load_complete([batched, None], 5000)
@@ -1,8 +1,23 @@
 # -*- coding: utf-8 -*-
 """Tests for lib/utilities"""
 
+import os
+import re
+import signal
+import socket
+import subprocess
+import tarfile
+
+from spet.lib.utilities import cache
+from spet.lib.utilities import cpu
+from spet.lib.utilities import download
 from spet.lib.utilities import execute
+from spet.lib.utilities import extract
+from spet.lib.utilities import file
+from spet.lib.utilities import grep
+from spet.lib.utilities import optimize
 from spet.lib.utilities import prettify
+from spet.lib.utilities import stats
 from spet.lib.utilities import uglify
 
 
@@ -31,6 +46,47 @@ def test_access__make_executable():
     TODO()
 
 
+########
+# cache
+########
+
+
+def test_cache__checksum(tmp_path):
+    """cache::checksum: should return the SHA-256 hex digest of a file"""
+    path = tmp_path / "artifact.txt"
+    path.write_text("hi\n")
+    result = cache.checksum(str(path))
+    assert result == (
+        "98ea6e4f216f2fb4b69fff9b3a44842c38686ca685f3f55dc48c5d3fb1107be4")
+    assert cache.checksum(str(path)) == result
+    path.write_text("ho\n")
+    os.utime(str(path), ns=(1, 1))
+    assert cache.checksum(str(path)) != result
+
+
+def test_cache__verify(tmp_path):
+    """cache::verify: should only accept a file matching the checksum"""
+    path = tmp_path / "artifact.txt"
+    path.write_text("hi\n")
+    assert cache.verify(
+        str(path),
+        "98EA6E4F216F2FB4B69FFF9B3A44842C38686CA685F3F55DC48C5D3FB1107BE4")
+    assert not cache.verify(str(path), "0" * 64)
+    assert not cache.verify(str(tmp_path / "missing.txt"), "0" * 64)
+
+
+def test_cache__record_and_lookup(tmp_path):
+    """cache::record/lookup: should only return artifacts matching the record"""
+    manifest = str(tmp_path / ".cache" / "manifest.json")
+    path = tmp_path / "artifact.txt"
+    path.write_text("hi\n")
+    assert cache.lookup(manifest, "artifact.txt") is None
+    cache.record(manifest, "artifact.txt", str(path))
+    assert cache.lookup(manifest, "artifact.txt") == str(path)
+    path.write_text("truncated")
+    assert cache.lookup(manifest, "artifact.txt") is None
+
+
 ##########
 # cleanup
 ##########
@@ -41,6 +97,27 @@ def test_cleanup__remove_color_codes():
     TODO()
 
 
+######
+# cpu
+######
+
+
+def test_cpu__avx512_cflags(tmp_path):
+    """cpu::avx512_cflags: should only add AVX-512 flags the CPU reports"""
+    cpuinfo = tmp_path / "cpuinfo"
+    cpuinfo.write_text("processor\t: 0\n"
+                       "flags\t\t: fpu sse2 avx2 avx512f avx512cd avx512bw\n")
+    assert cpu.avx512_cflags(
+        str(cpuinfo)) == " -mavx512f -mavx512cd -mavx512bw "
+
+
+def test_cpu__recommended_j():
+    """cpu::recommended_j: should split the usable CPUs between containers"""
+    assert cpu.recommended_j() == cpu.count()
+    assert cpu.recommended_j(cpu.count()) == 1
+    assert cpu.recommended_j(cpu.count() * 2) == 1
+
+
 ###########
 # download
 ###########
@@ -51,6 +128,19 @@ def test_download__file():
     TODO()
 
 
+def test_download__concurrently():
+    """download::concurrently: should collect results and survive failures"""
+
+    def failing():
+        raise IOError("unreachable")
+
+    assert download.concurrently([lambda: True, failing, lambda: False]) == [
+        True,
+        None,
+        False,
+    ]
+
+
 ##########
 # execute
 ##########
@@ -62,11 +152,48 @@ def test_execute__output():
     assert result == "hi\n"
 
 
+def test_execute__stream():
+    """execute::stream: should yield each line of output"""
+    result = list(execute.stream('echo "hi"; echo "there"'))
+    assert result == ["hi\n", "there\n"]
+
+
+def test_execute__wait_for_port():
+    """execute::wait_for_port: should return once the port accepts connections"""
+    with socket.socket() as server:
+        server.bind(("localhost", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        assert execute.wait_for_port(port, timeout=1)
+    assert not execute.wait_for_port(port, timeout=0)
+
+
 def test_execute__timed():
     """timed: should time the sleep command correctly"""
     TODO()
 
 
+def test_execute__timed_args(tmp_path):
+    """timed_args: should time the process and redirect its output"""
+    output = tmp_path / "output.txt"
+    assert execute.timed_args(["echo", "hi"], stdout_path=str(output)) >= 0
+    assert output.read_text() == "hi\n"
+    assert execute.timed_args(["false"]) is None
+
+
+def test_execute__perf_runs():
+    """perf_runs: should recover both runs from a `perf stat -r 2` summary"""
+    output = """
+ Performance counter stats for 'make -j 8 vmlinux' (2 runs):
+
+            41.875 +- 0.625 seconds time elapsed  ( +-  1.49% )
+
+"""
+    assert execute.perf_runs(output) == [41.25, 42.5]
+    assert execute.perf_runs("perf: command not found") is None
+    assert execute.perf_runs(None) is None
+
+
 def test_execute__pkill():
     """pkill: should kill all processes containing the name."""
     NOT_IMPLEMENTING()  # Deprecated in favor of `kill`
@@ -77,14 +204,55 @@ def test_execute__kill():
     TODO()
 
 
+def test_execute__alive():
+    """alive: should only report running processes"""
+    proc = subprocess.Popen(["sleep", "60"])
+    assert execute.alive(str(proc.pid))
+    proc.kill()
+    assert proc.wait(timeout=1)
+    assert not execute.alive(str(proc.pid))
+    assert not execute.alive("not a pid")
+
+
+def test_execute__terminate():
+    """terminate: should stop the process with the PID and wait for it"""
+    proc = subprocess.Popen(["sleep", "60"])
+    assert execute.terminate(str(proc.pid), timeout=1)
+    assert proc.wait(timeout=1) == -signal.SIGTERM
+    assert execute.terminate("not a pid") is False
+
+
 ##########
 # extract
 ##########
 
 
-def test_extract__tar():
+def test_extract__tar(tmp_path):
     """extract::tar: should extract tar, tar.gz, and tgz files"""
-    TODO()
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "Makefile").write_text("all:\n")
+    for name, mode in (("a.tar", "w"), ("b.tar.gz", "w:gz"), ("c.tgz", "w:gz")):
+        archive = str(tmp_path / name)
+        with tarfile.open(archive, mode) as tar_file:
+            tar_file.add(str(source), arcname="pkg")
+        output_dir = tmp_path / ("out_" + name)
+        output_dir.mkdir()
+        extract.tar(archive, str(output_dir))
+        assert (output_dir / "pkg" / "Makefile").read_text() == "all:\n"
+
+
+def test_extract__tar_stripped(tmp_path):
+    """extract::tar_stripped: should extract without the leading directory"""
+    source = tmp_path / "hpl-2.2"
+    source.mkdir()
+    (source / "Makefile").write_text("all:\n")
+    archive = str(tmp_path / "hpl-2.2.tar.gz")
+    with tarfile.open(archive, "w:gz") as tar_file:
+        tar_file.add(str(source), arcname="hpl-2.2")
+    output_dir = tmp_path / "hpl"
+    assert extract.tar_stripped(archive, str(output_dir), "hpl-2.2/")
+    assert (output_dir / "Makefile").read_text() == "all:\n"
 
 
 #######
@@ -107,11 +275,56 @@ def test_file__write():
     TODO()
 
 
+def test_file__missing(tmp_path):
+    """file::missing: should return the first path that does not exist"""
+    present = tmp_path / "present.txt"
+    present.write_text("")
+    absent = str(tmp_path / "absent.txt")
+    assert file.missing([str(present), str(tmp_path)]) is None
+    assert file.missing([str(present), absent]) == absent
+    assert file.missing([str(present / "child")]) == str(present / "child")
+
+
+def test_file__write_dontneed(tmp_path):
+    """file::write_dontneed: should write to a file"""
+    path = tmp_path / "output.txt"
+    path.write_text("stale contents\n")
+    file.write_dontneed(str(path), "hi\n")
+    assert path.read_text() == "hi\n"
+
+
+def test_file__dontneed(tmp_path):
+    """file::dontneed: should leave the file contents unchanged"""
+    path = tmp_path / "output.txt"
+    path.write_text("hi\n")
+    file.dontneed(str(path))
+    assert path.read_text() == "hi\n"
+    file.dontneed(str(tmp_path / "missing.txt"))
+
+
+def test_file__willneed(tmp_path):
+    """file::willneed: should leave the file contents unchanged"""
+    path = tmp_path / "corpus.txt"
+    path.write_text("hi\n")
+    file.willneed(str(path))
+    assert path.read_text() == "hi\n"
+    file.willneed(str(tmp_path / "missing.txt"))
+
+
 def test_file__replace_line():
     """file::replace_line: should replace a line in a file"""
     TODO()
 
 
+def test_file__replace_lines(tmp_path):
+    """file::replace_lines: should apply every substitution to each line"""
+    path = tmp_path / "HPL.dat"
+    path.write_text("1            # of NBs\n192          NBs\n4  Ps\n")
+    file.replace_lines(str(path), [(r"(\d+\s)+\s*NBs", "384    NBs"),
+                                   (r"([0-9]+\s+)+Ps", "8  Ps")])
+    assert path.read_text() == "1            # of NBs\n384    NBs\n8  Ps\n"
+
+
 #######
 # grep
 #######
@@ -124,7 +337,10 @@ def test_grep_file():
 
 def test_grep_text():
     """grep::text: should return all lines matching the pattern"""
-    TODO()
+    body = "[OVERALL], Throughput(ops/sec), 1.0\n[READ], Operations, 5\n"
+    assert grep.text(body,
+                     r"\[OVERALL\]") == ["[OVERALL], Throughput(ops/sec), 1.0"]
+    assert grep.text(body, re.compile(r"^\[")) == body.rstrip().split("\n")
 
 
 ############
@@ -167,6 +383,23 @@ def test_optimize__prerun():
     NOT_IMPLEMENTING()
 
 
+def test_optimize__prerun_memory_benchmark():
+    """optimize::prerun_memory_benchmark"""
+    NOT_IMPLEMENTING()
+
+
+def test_optimize__prerun_compute_benchmark():
+    """optimize::prerun_compute_benchmark"""
+    NOT_IMPLEMENTING()
+
+
+def test_optimize__wait_until_quiesced():
+    """optimize::wait_until_quiesced: should stop waiting once the load is low"""
+    assert optimize.wait_until_quiesced(max_sleep=10,
+                                        load_threshold=float("inf")) < 1
+    assert optimize.wait_until_quiesced(max_sleep=0.3, load_threshold=-1) < 1
+
+
 def test_optimize__ulimit():
     """optimize::ulimit"""
     NOT_IMPLEMENTING()
@@ -254,6 +487,23 @@ def test_run_num__read():
     TODO()
 
 
+########
+# stats
+########
+
+
+def test_stats__summarize():
+    """stats::summarize: should summarize odd and even numbers of runs"""
+    assert stats.summarize([3.0, 1.0, 2.0]) == {
+        "average": 2.0,
+        "median": 2.0,
+        "variance": 1.0,
+        "range": 2.0,
+    }
+    assert stats.summarize([4.0, 1.0])["median"] == 2.5
+    assert stats.summarize([5.0])["variance"] == 0.0
+
+
 #########
 # uglify
 #########